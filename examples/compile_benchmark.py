@@ -0,0 +1,199 @@
+"""
+Compare eager and compiled forward_pass throughput.
+
+Uses the network configs from fashion_conv_dense_test.py with random
+inputs so no dataset download is needed. Run from the examples folder:
+
+    python compile_benchmark.py --samples 2000 --batch-size 100
+"""
+import sys
+sys.path.append('../')
+import argparse
+import time
+from copy import deepcopy
+
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from vulcanai2.models import ConvNet, DenseNet
+from vulcanai2.datasets import MultiDataset
+
+
+conv_1D_config = {
+    'conv_units': [
+                    dict(
+                        in_channels=1,
+                        out_channels=16,
+                        kernel_size=(5),
+                        stride=2,
+                        dropout=0.1
+                    ),
+                    dict(
+                        in_channels=16,
+                        out_channels=32,
+                        kernel_size=(5),
+                        padding=0,
+                        dropout=0.1
+                    ),
+                    dict(
+                        in_channels=32,
+                        out_channels=64,
+                        kernel_size=(5),
+                        pool_size=2,
+                        dropout=0.1
+                        )
+    ],
+}
+conv_2D_config = {
+    'conv_units': [
+                    dict(
+                        in_channels=1,
+                        out_channels=16,
+                        kernel_size=(5, 5),
+                        stride=2,
+                        dropout=0.1
+                    ),
+                    dict(
+                        in_channels=16,
+                        out_channels=32,
+                        kernel_size=(5, 5),
+                        dropout=0.1
+                    ),
+                    dict(
+                        in_channels=32,
+                        out_channels=64,
+                        kernel_size=(5, 5),
+                        pool_size=2,
+                        dropout=0.1
+                        )
+    ],
+}
+conv_3D_config = {
+    'conv_units': [
+                    dict(
+                        in_channels=1,
+                        out_channels=16,
+                        kernel_size=(5, 5, 5),
+                        stride=2,
+                        dropout=0.1
+                    ),
+                    dict(
+                        in_channels=16,
+                        out_channels=16,
+                        kernel_size=(5, 5, 5),
+                        stride=1,
+                        dropout=0.1
+                    ),
+                    dict(
+                        in_channels=16,
+                        out_channels=64,
+                        kernel_size=(5, 5, 5),
+                        dropout=0.1
+                    ),
+    ],
+}
+multi_input_conv_3D_config = {
+    'conv_units': [
+                    dict(
+                        in_channels=1,
+                        out_channels=16,
+                        kernel_size=(3, 3, 3),
+                        stride=2,
+                        dropout=0.1
+                    ),
+    ],
+}
+dense_config = {
+    'dense_units': [100, 50],
+    'initializer': None,
+    'bias_init': None,
+    'norm': None,
+    'dropout': 0.5,  # Single value or List
+}
+
+
+def build_networks():
+    """Build the example networks."""
+    conv_1D = ConvNet(name='conv_1D', in_dim=(1, 28),
+                      config=deepcopy(conv_1D_config), device='cpu')
+    conv_2D = ConvNet(name='conv_2D', in_dim=(1, 28, 28),
+                      config=deepcopy(conv_2D_config), device='cpu')
+    conv_3D = ConvNet(name='conv_3D', in_dim=(1, 28, 28, 28),
+                      config=deepcopy(conv_3D_config), device='cpu')
+    dense_model = DenseNet(
+        name='dense_model',
+        input_networks=[conv_2D, conv_1D],
+        config=deepcopy(dense_config),
+        device='cpu')
+    multi_input_conv_3D = ConvNet(
+        name='multi_input_conv_3D',
+        input_networks=[conv_1D, dense_model, conv_2D, conv_3D],
+        config=deepcopy(multi_input_conv_3D_config),
+        num_classes=10,
+        device='cpu')
+    return [conv_1D, conv_2D, conv_3D, dense_model, multi_input_conv_3D]
+
+
+def build_loader(network, n_samples, batch_size):
+    """Build a DataLoader of random inputs matching the network inputs."""
+    def leaf_dataset(net):
+        return TensorDataset(
+            torch.rand([n_samples, *net.in_dim]),
+            torch.randint(10, [n_samples]))
+
+    def multi_dataset(net, with_target):
+        # Nested MultiDatasets always overwrite the target,
+        # so it has to come from the last input.
+        dataset_tuples = []
+        n_inputs = len(net.input_networks)
+        for idx, in_net in enumerate(net.input_networks.values()):
+            use_target = with_target and idx == n_inputs - 1
+            if in_net.input_networks:
+                dataset_tuples.append(multi_dataset(in_net, use_target))
+            else:
+                dataset_tuples.append(
+                    (leaf_dataset(in_net), True, use_target))
+        return MultiDataset(dataset_tuples)
+
+    if network.input_networks:
+        dataset = multi_dataset(network, with_target=True)
+    else:
+        dataset = leaf_dataset(network)
+    return DataLoader(dataset, batch_size=batch_size)
+
+
+def throughput(network, data_loader, repeats):
+    """Return forward_pass samples/sec, best of repeats."""
+    network.forward_pass(data_loader)  # Warm up
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        network.forward_pass(data_loader)
+        best = min(best, time.perf_counter() - start)
+    return len(data_loader.dataset) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    for network in build_networks():
+        # Copies run eagerly, so compiling one network doesn't affect
+        # the eager baseline of the networks using it as an input.
+        network = deepcopy(network)
+        data_loader = build_loader(network, args.samples, args.batch_size)
+        eager = throughput(network, data_loader, args.repeats)
+        compiled = network.compile()
+        after = throughput(network, data_loader, args.repeats)
+        print("{:<22} eager: {:>9.1f} samples/s | compiled{}: {:>9.1f} "
+              "samples/s | speedup: {:.2f}x".format(
+                  network.name, eager,
+                  '' if compiled else ' (fell back to eager)',
+                  after, after / eager))
+
+
+if __name__ == '__main__':
+    main()
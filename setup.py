@@ -11,21 +11,23 @@ setup(
     author='Robert Fratila, Priyatharsan Rajasekar, Caitrin Armstrong',
     author_email='robertfratila10@gmail.com',
     url='https://github.com/Aifred-Health/Vulcan', #TODO: make sure we've updated appropriately
-    install_requires=['numpy>=1.12.0',
+    install_requires=['numpy>=1.15.0',
                       'scipy>=0.17.1',
                       'matplotlib>=1.5.3',
                       'scikit-learn>=0.18',
                       'jsonschema>=2.6.0',
-                      'torch>=0.4',
+                      'torch>=2.0',
                       'pydash>=4.7.3',
                       'tqdm>=4.25.0'],
     packages=['vulcanai2'],
+    python_requires='>=3.8',
     classifiers=['Development Status :: 3 - Alpha',
                  'Intended Audience :: Developers',
                  'Intended Audience :: Science/Research',
                  'Intended Audience :: Education',
                  'Topic :: Software Development :: Build Tools',
-                 'Programming Language :: Python :: 3.6',
+                 'Programming Language :: Python :: 3.8',
+                 'Programming Language :: Python :: 3.9',
                  'Operating System :: Unix',
                  'Operating System :: POSIX :: Linux',
                  'Topic :: Scientific/Engineering :: Artificial Intelligence'],
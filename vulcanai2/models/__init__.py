@@ -13,6 +13,7 @@ __all__ = [
     'layers',
     'ensemble',
     'metrics',
+    'serving',
     'utils',
     'BaseNetwork',
     'ConvNet',
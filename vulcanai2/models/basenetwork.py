@@ -4,21 +4,37 @@
 import abc
 import torch
 from torch import nn
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.utils.hooks import RemovableHandle
+from torch.utils.data import DataLoader, SequentialSampler, Subset
 
 # Vulcan imports
 from .layers import *
-from .utils import set_tensor_device
+from .utils import set_tensor_device, split_batch, clone_tensors
+from .utils import DataPrefetcher, PhaseTimer
+from .utils import EarlyStopping, CheckpointWriter, shard_data_loader
+from .utils import DeferredInterrupt
+from .utils import EmbeddingCache, index_data_loader
 
-from .metrics import Metrics
+from .metrics import Metrics, MetricAccumulator
 from ..plotters.visualization import display_record
 
 # Generic imports
 import pydash as pdash
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm, trange
 from datetime import datetime
 import logging
+import io
 import os
+import copy
+import time
 import pickle
+import json
+import socket
+import tempfile
 import numpy as np
 
 import matplotlib
@@ -32,6 +48,9 @@ warnings.filterwarnings("ignore")
 sns.set(style='dark')
 logger = logging.getLogger(__name__)
 
+# Seconds fit(workers=N) waits for the other ranks to exit after rank 0.
+_WORKER_JOIN_TIMEOUT = 60
+
 
 class BaseNetwork(nn.Module):
     """
@@ -60,8 +79,10 @@ class BaseNetwork(nn.Module):
         A dictionary of parameters for the desired optimizer.
     lr_scheduler : torch.optim.lr_scheduler
         A callable torch.optim.lr_scheduler
-    early_stopping : str or None
-        So far just 'best_validation_error' is implemented.
+    early_stopping : str, dict or None
+        Either 'best_validation_error' or 'best_validation_accuracy', or a
+        dict with that rule as 'name' and optional 'patience' and
+        'min_delta'. The best weights are restored at the end of fit.
     criter_spec : dict
         criterion specification with name and all its parameters.
     device : str or torch.device
@@ -119,9 +140,15 @@ class BaseNetwork(nn.Module):
             train_error=[],
             train_accuracy=[],
             validation_error=[],
-            validation_accuracy=[]
+            validation_accuracy=[],
+            train_samples_per_sec=[],
+            validation_samples_per_sec=[],
+            train_phase_times=[],
+            validation_phase_times=[]
         )
 
+        self._epoch_hooks = OrderedDict()
+
         if in_dim:
             if isinstance(in_dim, int):
                 self.in_dim = tuple([in_dim])
@@ -143,6 +170,20 @@ class BaseNetwork(nn.Module):
         self.device = device
         self._criter_spec = criter_spec
 
+        # Set by compile(). Kept out of the registered submodules so they
+        # don't show up in the state_dict.
+        self._compiled_network = None
+        self._compiled_merge = None
+
+        # Set by parallelize_inputs()
+        self._parallel_inputs = False
+        self._input_executor = None
+
+        # Set by enable_embedding_cache()
+        self._cache_embeddings = False
+        self._embedding_cache_dir = None
+        self._embedding_caches = {}
+
     def add_input_network(self, in_network):
         """
         Add a new network to  an input for this network.
@@ -173,7 +214,8 @@ class BaseNetwork(nn.Module):
         """Abstract method used to define how to handle multi-inputs."""
         raise NotImplementedError
 
-    def forward(self, inputs, **kwargs):
+    def forward(self, inputs, embedding_caches=None, cache_keys=None,
+                **kwargs):
         """
         Perform a forward pass through the modules.
 
@@ -187,6 +229,11 @@ class BaseNetwork(nn.Module):
         ----------
         inputs : list(torch.Tensor)
             The inputs to pass throught the network.
+        embedding_caches : dict or None
+            EmbeddingCache per input network name, used in place of
+            running those input networks. See enable_embedding_cache.
+        cache_keys : torch.LongTensor or None
+            The dataset indices of the samples in inputs.
 
         Returns
         -------
@@ -197,14 +244,15 @@ class BaseNetwork(nn.Module):
             inputs = [inputs]
 
         if self.input_networks:
-            net_outs = []
             # Loop through all input networks and pass through respective
             # input data tensors to collect their outputs. Use the specified
             # merge_inputs functionality to combine all the outputs to create
             # the input for this network.
-            for in_net, x in zip(self.input_networks.values(), inputs):
-                net_outs.append(in_net(x))
-            output = self._merge_input_network_outputs(net_outs)
+            net_outs = self._input_network_forward(
+                inputs, embedding_caches, cache_keys)
+            merge = getattr(self, '_compiled_merge', None) or \
+                self._merge_input_network_outputs
+            output = merge(net_outs)
         else:
             output = torch.cat(inputs, dim=1)
 
@@ -215,7 +263,456 @@ class BaseNetwork(nn.Module):
                 "Input data incorrect dimension shape for network: {}. "
                 "Expecting shape {} but recieved shape {}".format(
                     self.name, self.in_dim, output.shape[1:]))
-        return self.network(output)
+        network = getattr(self, '_compiled_network', None) or self.network
+        return network(output)
+
+    def parallelize_inputs(self, enabled=True, apply_inputs=True):
+        """
+        Run the input networks concurrently in forward.
+
+        The input network branches are independent, so each one after
+        the first is submitted to a thread pool while the calling
+        thread runs the first, and their outputs are merged once all
+        are done. Torch ops release the GIL, so heavy branches use the
+        idle cores. Gradient and autocast modes carry over to the pool.
+
+        Parameters
+        ----------
+        enabled : boolean
+            Whether to run the input networks concurrently.
+        apply_inputs : boolean
+            Whether to apply this to all input networks recursively.
+
+        Returns
+        -------
+        None
+
+        """
+        if apply_inputs and self.input_networks:
+            for in_net in self.input_networks.values():
+                in_net.parallelize_inputs(
+                    enabled=enabled, apply_inputs=apply_inputs)
+        self._parallel_inputs = enabled
+        self._shutdown_input_executor()
+
+    def _get_input_executor(self):
+        """Return the input network thread pool, or None to run in turn."""
+        if not getattr(self, '_parallel_inputs', False) or \
+                len(self.input_networks) < 2:
+            return None
+        if self._input_executor is None:
+            # The calling thread runs one branch itself
+            self._input_executor = ThreadPoolExecutor(
+                max_workers=min(len(self.input_networks) - 1,
+                                os.cpu_count() or 1))
+        return self._input_executor
+
+    def _shutdown_input_executor(self):
+        executor = getattr(self, '_input_executor', None)
+        self._input_executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _input_network_forward(self, inputs, embedding_caches=None,
+                               cache_keys=None):
+        """Return the output of each input network for inputs."""
+        branches = list(zip(self.input_networks.values(), inputs))
+        net_outs = [None] * len(branches)
+        pending = []
+        for idx, (in_net, x) in enumerate(branches):
+            cache = None
+            if embedding_caches and cache_keys is not None:
+                cache = embedding_caches.get(in_net.name)
+            if cache is None:
+                pending.append(idx)
+            else:
+                net_outs[idx] = self._cached_input_forward(
+                    in_net, x, cache, cache_keys)
+
+        executor = self._get_input_executor()
+        if executor is None or len(pending) < 2:
+            for idx in pending:
+                in_net, x = branches[idx]
+                net_outs[idx] = in_net(x)
+            return net_outs
+
+        # Grad and autocast modes are thread local
+        autocast_enabled, autocast_dtype = _autocast_state(self.device.type)
+        modes = dict(
+            grad_enabled=torch.is_grad_enabled(),
+            device_type=self.device.type,
+            autocast_enabled=autocast_enabled,
+            autocast_dtype=autocast_dtype)
+        futures = [(idx, executor.submit(_forward_branch, *branches[idx],
+                                         **modes))
+                   for idx in pending[1:]]
+        in_net, x = branches[pending[0]]
+        net_outs[pending[0]] = in_net(x)
+        for idx, future in futures:
+            net_outs[idx] = future.result()
+        return net_outs
+
+    def enable_embedding_cache(self, enabled=True, cache_dir=None):
+        """
+        Cache the outputs of frozen input networks during fit.
+
+        Input networks without any trainable parameters, e.g. after
+        freeze(apply_inputs=True), are treated as fixed feature
+        extractors: they run in eval mode and their outputs for each
+        sample of the train and validation datasets are stored the first
+        time they are computed, keyed by dataset index. Later epochs
+        reuse the stored outputs instead of running those networks.
+        The caches are rebuilt when the set of frozen input networks
+        changes; call clear_embedding_cache after changing their weights.
+
+        Parameters
+        ----------
+        enabled : boolean
+            Whether to cache frozen input network outputs.
+        cache_dir : str or None
+            Directory to store the outputs in as memory-mapped files.
+            Outputs are kept in memory if None.
+
+        Returns
+        -------
+        None
+
+        """
+        if cache_dir is not None and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.clear_embedding_cache()
+        self._cache_embeddings = enabled
+        self._embedding_cache_dir = cache_dir
+
+    def clear_embedding_cache(self):
+        """Discard all cached input network outputs."""
+        for _, caches in getattr(self, '_embedding_caches', {}).values():
+            for cache in caches.values():
+                cache.close()
+        self._embedding_caches = {}
+
+    def _get_embedding_caches(self, dataset):
+        """
+        Return the embedding caches of the frozen input networks.
+
+        Parameters
+        ----------
+        dataset : torch.utils.data.Dataset
+            The dataset the caches are keyed on.
+
+        Returns
+        -------
+        embedding_caches : dict or None
+            EmbeddingCache per frozen input network name, or None if
+            there is nothing to cache.
+
+        """
+        if not getattr(self, '_cache_embeddings', False) or \
+                not self.input_networks:
+            return None
+        frozen_nets = [
+            in_net for in_net in self.input_networks.values()
+            if not any(p.requires_grad for p in in_net.parameters())]
+        if not frozen_nets:
+            return None
+
+        # Datasets are kept with their caches so their ids aren't reused
+        _, caches = self._embedding_caches.setdefault(
+            id(dataset), (dataset, {}))
+        frozen_names = [in_net.name for in_net in frozen_nets]
+        for name in list(caches):
+            if name not in frozen_names:
+                caches.pop(name).close()
+        for in_net in frozen_nets:
+            if in_net.name not in caches:
+                path = None
+                if self._embedding_cache_dir is not None:
+                    fd, path = tempfile.mkstemp(
+                        prefix='{}_{}_'.format(self.name, in_net.name),
+                        suffix='.npy', dir=self._embedding_cache_dir)
+                    os.close(fd)
+                caches[in_net.name] = EmbeddingCache(
+                    len(dataset), in_net.out_dim, path=path)
+        return caches
+
+    def _cached_input_forward(self, in_net, x, cache, cache_keys):
+        """Return the cached in_net outputs, computing missing ones."""
+        out = cache.lookup(cache_keys)
+        if out is None:
+            was_training = in_net.training
+            in_net.eval()
+            with torch.no_grad():
+                out = in_net(x)
+            in_net.train(was_training)
+            cache.store(cache_keys, out)
+            return out
+        return set_tensor_device(out, device=self.device)
+
+    def compile(self, apply_inputs=True, **compile_kwargs):
+        """
+        Compile the network into an optimized graph with torch.compile.
+
+        Compiles self.network and, for multi-input networks, the merge of
+        the input network outputs. forward, fit and forward_pass then use
+        the compiled versions. Each is run once on dummy data so failures
+        are caught here, in which case the network stays in eager mode.
+        Compiled graphs are not pickled; reloaded or copied networks run
+        eagerly until compiled again.
+
+        Parameters
+        ----------
+        apply_inputs : boolean
+            Whether to compile all input networks recursively.
+        compile_kwargs : dict
+            Extra keyword arguments passed on to torch.compile.
+
+        Returns
+        -------
+        compiled : boolean
+            Whether this network was compiled successfully.
+
+        """
+        if apply_inputs and self.input_networks:
+            for in_net in self.input_networks.values():
+                in_net.compile(apply_inputs=apply_inputs, **compile_kwargs)
+
+        was_training = self.training
+        self.eval()
+        try:
+            with torch.no_grad():
+                if self.input_networks:
+                    compiled_merge = torch.compile(
+                        self._merge_input_network_outputs, **compile_kwargs)
+                    compiled_merge([
+                        torch.ones([2, *in_net.out_dim], device=self.device)
+                        for in_net in self.input_networks.values()])
+                    self._compiled_merge = compiled_merge
+                compiled_network = torch.compile(
+                    self.network, **compile_kwargs)
+                compiled_network(
+                    torch.ones([2, *self.in_dim], device=self.device))
+            # Bypass nn.Module registration, see __init__
+            object.__setattr__(self, '_compiled_network', compiled_network)
+        except Exception as e:
+            logger.warning(
+                "Compiling {} failed, falling back to eager mode: {}".format(
+                    self.name, e))
+            self._compiled_merge = None
+            self._compiled_network = None
+            return False
+        finally:
+            self.train(was_training)
+        return True
+
+    def quantize(self, calibration_loader=None, backend=None):
+        """
+        Create an int8 copy of the network for cpu inference.
+
+        The Linear kernels of every DenseUnit are dynamically quantized.
+        The kernels of every ConvUnit, fused with their batch norm, are
+        statically quantized using activation ranges observed on
+        calibration_loader. Without a calibration_loader ConvUnits stay
+        in float32. Input networks are quantized as well.
+
+        The copy works with forward_pass, run_test and the other Metrics
+        functions, so the accuracy cost can be measured against self.
+        Its quantization_report holds the size and latency reduction.
+
+        Parameters
+        ----------
+        calibration_loader : DataLoader or None
+            Representative data used to calibrate the ConvUnits, and to
+            compare latencies.
+        backend : str or None
+            The quantized engine to use, e.g. 'x86', 'fbgemm' or 'qnnpack'.
+            Defaults to torch.backends.quantized.engine.
+
+        Returns
+        -------
+        quantized_network : BaseNetwork
+            The int8 copy of the network, on cpu.
+
+        """
+        if backend is not None:
+            if backend not in torch.backends.quantized.supported_engines:
+                raise ValueError(
+                    "Quantized backend {} is not supported here, use one of "
+                    "{}.".format(
+                        backend, torch.backends.quantized.supported_engines))
+            torch.backends.quantized.engine = backend
+        qconfig = torch.ao.quantization.get_default_qconfig(
+            torch.backends.quantized.engine)
+
+        float_network = copy.deepcopy(self).cpu()
+        float_network.eval()
+        quantized = copy.deepcopy(float_network)
+
+        conv_units = [m for m in quantized.modules()
+                      if isinstance(m, ConvUnit)]
+        if conv_units and calibration_loader is None:
+            logger.warning(
+                "No calibration_loader given, ConvUnits of {} are left "
+                "in float32.".format(self.name))
+        elif conv_units:
+            for unit in conv_units:
+                self._wrap_conv_unit_for_quantization(unit, qconfig)
+            torch.ao.quantization.prepare(quantized, inplace=True)
+            # Observers record activation ranges during these passes
+            quantized.forward_pass(calibration_loader)
+            torch.ao.quantization.convert(quantized, inplace=True)
+
+        dense_kernels = {'{}._kernel'.format(name)
+                         for name, m in quantized.named_modules()
+                         if isinstance(m, DenseUnit)}
+        torch.ao.quantization.quantize_dynamic(
+            quantized, qconfig_spec=dense_kernels, dtype=torch.qint8,
+            inplace=True)
+
+        quantized.quantization_report = self._quantization_report(
+            float_network, quantized, calibration_loader)
+        logger.info("Quantized {}: {}".format(
+            self.name, quantized.quantization_report))
+        return quantized
+
+    @staticmethod
+    def _wrap_conv_unit_for_quantization(unit, qconfig):
+        """Fuse a ConvUnit kernel with its norm and quantize around it."""
+        fuse = ['_kernel']
+        norm = getattr(unit, '_norm', None)
+        if isinstance(norm, nn.modules.batchnorm._BatchNorm):
+            fuse.append('_norm')
+            if isinstance(getattr(unit, '_activation', None), nn.ReLU):
+                fuse.append('_activation')
+        if len(fuse) > 1:
+            torch.ao.quantization.fuse_modules(unit, [fuse], inplace=True)
+        # Quantize the kernel input and dequantize its output so the
+        # rest of the unit keeps running on float tensors.
+        unit._kernel = torch.ao.quantization.QuantWrapper(unit._kernel)
+        unit._kernel.qconfig = qconfig
+
+    @staticmethod
+    def _quantization_report(float_network, quantized, data_loader):
+        """Compare the size and latency of a network and its int8 copy."""
+        def size_mb(network):
+            buffer = io.BytesIO()
+            torch.save(network.state_dict(), buffer)
+            return buffer.tell() / 1e6
+
+        def latency_ms(network):
+            network.forward_pass(data_loader)  # Warm up
+            start = time.perf_counter()
+            network.forward_pass(data_loader)
+            return (time.perf_counter() - start) * 1000 / len(data_loader)
+
+        report = dict(
+            float_size_mb=size_mb(float_network),
+            int8_size_mb=size_mb(quantized))
+        report['size_reduction'] = \
+            1 - report['int8_size_mb'] / report['float_size_mb']
+        if data_loader is not None:
+            report['float_batch_latency_ms'] = latency_ms(float_network)
+            report['int8_batch_latency_ms'] = latency_ms(quantized)
+            report['latency_reduction'] = \
+                1 - report['int8_batch_latency_ms'] / \
+                report['float_batch_latency_ms']
+        return report
+
+    def fuse_for_inference(self, input_mean=None, input_std=None):
+        """
+        Create a lean copy of the network for inference.
+
+        Batch norms are folded into the weights of the preceding kernel
+        of every ConvUnit and DenseUnit and dropout modules are removed,
+        including in the input networks. Optionally, an input
+        normalization (x - input_mean) / input_std like the Normalize
+        transform in FashionData is folded into the first kernel, so the
+        copy expects raw inputs. The copy is in eval mode and should
+        not be trained further.
+
+        Parameters
+        ----------
+        input_mean : float, list of float or None
+            The normalization mean, one per input channel (or feature).
+        input_std : float, list of float or None
+            The normalization standard deviation, one per input channel
+            (or feature).
+
+        Returns
+        -------
+        fused_network : BaseNetwork
+            The fused copy of the network.
+
+        """
+        if (input_mean is None) != (input_std is None):
+            raise ValueError(
+                "input_mean and input_std must be specified together.")
+        if input_mean is not None and self.input_networks:
+            raise ValueError(
+                "Input normalization can only be folded into a network "
+                "without input_networks.")
+
+        fused = copy.deepcopy(self)
+        fused.eval()
+        for unit in list(fused.modules()):
+            if isinstance(unit, (ConvUnit, DenseUnit)):
+                self._fuse_unit(unit)
+
+        if input_mean is not None:
+            self._fold_input_normalization(
+                fused.network[0], input_mean, input_std)
+        return fused
+
+    @staticmethod
+    def _fuse_unit(unit):
+        """Fold the batch norm of unit into its kernel, drop its dropout."""
+        norm = getattr(unit, '_norm', None)
+        # Batch norm without running stats normalizes with batch stats.
+        if isinstance(norm, nn.modules.batchnorm._BatchNorm) and \
+                norm.track_running_stats:
+            if isinstance(unit, ConvUnit):
+                unit._kernel = nn.utils.fusion.fuse_conv_bn_eval(
+                    unit._kernel, norm)
+            else:
+                unit._kernel = nn.utils.fusion.fuse_linear_bn_eval(
+                    unit._kernel, norm)
+            del unit._norm
+        if hasattr(unit, '_dropout'):
+            del unit._dropout
+
+    @staticmethod
+    @torch.no_grad()
+    def _fold_input_normalization(unit, input_mean, input_std):
+        """Fold (x - input_mean) / input_std into the kernel of unit."""
+        kernel = unit._kernel
+        if isinstance(unit, ConvUnit) and any(kernel.padding):
+            # Zero padding of raw inputs isn't zero once normalized
+            raise ValueError(
+                "Input normalization can't be folded into a padded conv.")
+        n_inputs = kernel.weight.shape[1]
+        mean = torch.as_tensor(input_mean, dtype=kernel.weight.dtype,
+                               device=kernel.weight.device).flatten()
+        std = torch.as_tensor(input_std, dtype=kernel.weight.dtype,
+                              device=kernel.weight.device).flatten()
+        if len(mean) not in (1, n_inputs) or len(std) not in (1, n_inputs):
+            raise ValueError(
+                "input_mean and input_std must have 1 or {} values.".format(
+                    n_inputs))
+        # Broadcast over the input channel (or feature) dimension
+        shape = [1, -1] + [1] * (kernel.weight.dim() - 2)
+        kernel.weight.div_(std.expand(n_inputs).view(shape))
+        kernel.bias.sub_(
+            (kernel.weight * mean.expand(n_inputs).view(shape)).sum(
+                dim=list(range(1, kernel.weight.dim()))))
+
+    def __getstate__(self):
+        """Drop compiled graphs, hooks, thread pools and caches."""
+        state = self.__dict__.copy()
+        state['_compiled_network'] = None
+        state['_compiled_merge'] = None
+        state['_epoch_hooks'] = OrderedDict()
+        state['_input_executor'] = None
+        state['_embedding_caches'] = {}
+        return state
 
     def extra_repr(self):
         """Set the extra representation of the module."""
@@ -235,7 +732,12 @@ class BaseNetwork(nn.Module):
 
         """
         if self.network:
+            # Eval mode so batch norms accept a single sample and their
+            # running stats aren't updated with made-up data.
+            was_training = self.network.training
+            self.network.eval()
             out = self.network(torch.ones([1, *self.in_dim]))
+            self.network.train(was_training)
             return tuple(out.shape[1:])
         else:
             return None
@@ -272,7 +774,12 @@ class BaseNetwork(nn.Module):
             Relevant device associalted with the network module.
 
         """
-        return next(self.network.parameters()).device
+        try:
+            return next(self.network.parameters()).device
+        except StopIteration:
+            # Fully quantized networks keep their weights packed, not as
+            # parameters, and only run on cpu.
+            return torch.device('cpu')
 
     @device.setter
     def device(self, device):
@@ -370,7 +877,7 @@ class BaseNetwork(nn.Module):
 
         Returns
         -------
-        stopping_rule : str
+        stopping_rule : str, dict or None
             The stoping rule
 
         """
@@ -483,6 +990,14 @@ class BaseNetwork(nn.Module):
         optim_spec = pdash.omit(optim_spec, "name")
         return optim_class(self.parameters(), **optim_spec)
 
+    @staticmethod
+    def _init_early_stopping(early_stopping_spec):
+        if early_stopping_spec is None:
+            return None
+        if isinstance(early_stopping_spec, str):
+            return EarlyStopping(name=early_stopping_spec)
+        return EarlyStopping(**early_stopping_spec)
+
     @staticmethod
     def _init_criterion(criterion_spec):
         return criterion_spec
@@ -525,8 +1040,34 @@ class BaseNetwork(nn.Module):
                     comparison_device,
                     incompatible_collector))
 
+    def _autocast(self, enabled):
+        """
+        Return the bfloat16 autocast context for the network's device.
+
+        bfloat16 keeps the float32 exponent range so, unlike float16,
+        gradients don't underflow and no loss scaling is required.
+        Parameters are left in float32 and serve as master weights.
+
+        Parameters
+        ----------
+        enabled : boolean
+            Whether to run the enclosed ops in mixed precision.
+
+        Returns
+        -------
+        context : torch.autocast
+
+        """
+        return torch.autocast(
+            device_type=self.device.type,
+            dtype=torch.bfloat16,
+            enabled=enabled)
+
     def fit(self, train_loader, val_loader, epochs,
-            retain_graph=None, valid_interv=4, plot=False):
+            retain_graph=None, valid_interv=4, plot=False,
+            mixed_precision=False, accumulate_steps=1,
+            checkpoint_path=None, checkpoint_interv=None,
+            checkpoint_secs=None, workers=1, profile=False):
         """
         Train the network on the provided data.
 
@@ -544,12 +1085,61 @@ class BaseNetwork(nn.Module):
             Specifies the period of epochs before validation calculation.
         plot : boolean
             Whether or not to plot training metrics in real-time.
+        mixed_precision : boolean
+            Whether to run the forward pass and loss under bfloat16
+            autocast. Weights and optimizer state remain float32.
+        accumulate_steps : int
+            The number of micro-batches each train_loader batch is split
+            into. Gradients are summed over the micro-batches before a
+            single optimizer step, so only one micro-batch of activations
+            is held in memory at a time.
+        checkpoint_path : str or None
+            Directory to periodically write checkpoints to. Checkpoints
+            are written on a background thread and can be loaded with
+            load_checkpoint.
+        checkpoint_interv : int or None
+            Specifies the period of epochs between checkpoints.
+        checkpoint_secs : float or None
+            Specifies the minimum number of seconds between checkpoints.
+            If neither this nor checkpoint_interv is given, a checkpoint
+            is written every epoch.
+        workers : int
+            The number of local CPU processes to train with. Each process
+            trains on a disjoint shard of train_loader and gradients are
+            averaged across processes every step. This process acts as
+            rank 0 and owns the record, logging, validation and
+            checkpoints. Ctrl-C stops every process at the end of the
+            current epoch. Scripts using this must guard their entry point
+            with `if __name__ == '__main__':`.
+        profile : boolean
+            Whether to synchronize the device after every training phase
+            so the phase times stored in the record are exact on
+            accelerators. Slows down training on accelerators; on cpu
+            the phase times are always exact.
 
         Returns
         -------
         None
 
         """
+        if accumulate_steps < 1:
+            raise ValueError(
+                "accumulate_steps must be >= 1, got {}".format(
+                    accumulate_steps))
+
+        if workers > 1:
+            return self._fit_distributed(
+                workers, train_loader, val_loader, epochs,
+                retain_graph=retain_graph, valid_interv=valid_interv,
+                plot=plot, mixed_precision=mixed_precision,
+                accumulate_steps=accumulate_steps,
+                checkpoint_path=checkpoint_path,
+                checkpoint_interv=checkpoint_interv,
+                checkpoint_secs=checkpoint_secs,
+                profile=profile)
+
+        is_rank_zero = self._get_rank() == 0
+
         # Check all networks are on same device.
         self._assert_same_devices()
 
@@ -558,37 +1148,80 @@ class BaseNetwork(nn.Module):
         if self.optim is None:
             self._init_trainer()
 
+        stopper = None
+        if is_rank_zero:
+            stopper = self._init_early_stopping(self._early_stopping)
+
+        writer = None
+        if checkpoint_path and is_rank_zero:
+            writer = CheckpointWriter(checkpoint_path)
+            if checkpoint_interv is None and checkpoint_secs is None:
+                checkpoint_interv = 1
+        last_checkpoint_time = time.time()
+
+        # A rank interrupted mid-epoch would leave the others blocked in a
+        # collective, so distributed ranks only act on Ctrl-C between epochs.
+        deferred_interrupt = DeferredInterrupt(
+            enabled=self._is_distributed())
+        deferred_interrupt.start()
         try:
             if plot:
                 fig_number = plt.gcf().number + 1 if plt.fignum_exists(1) else 1
                 plt.show()
 
-            for epoch in trange(epochs, desc='Epoch: '):
+            for epoch in trange(epochs, desc='Epoch: ',
+                                disable=not is_rank_zero):
 
-                train_loss, train_acc = self._train_epoch(train_loader,
-                                                          retain_graph)
+                # Reshuffle the shards differently every epoch
+                if hasattr(train_loader.sampler, 'set_epoch'):
+                    train_loader.sampler.set_epoch(self.epoch)
+
+                train_loss, train_acc, train_timing = self._train_epoch(
+                    train_loader, retain_graph,
+                    mixed_precision=mixed_precision,
+                    accumulate_steps=accumulate_steps,
+                    profile=profile)
                 if self.lr_scheduler:
                     self.lr_scheduler.step(epoch=epoch)
 
                 valid_loss = valid_acc = np.nan
-                if epoch % valid_interv == 0:
-                    valid_loss, valid_acc = self._validate(val_loader)
-
-                tqdm.write(
-                    "\n Epoch {}:\n"
-                    "Train Loss: {:.6f} | Test Loss: {:.6f} |"
-                    "Train Acc: {:.4f} | Test Acc: {:.4f}".format(
-                        self.epoch,
-                        train_loss,
-                        valid_loss,
-                        train_acc,
-                        valid_acc))
+                valid_timing = dict(samples_per_sec=np.nan, phase_times={})
+                if epoch % valid_interv == 0 and is_rank_zero:
+                    valid_loss, valid_acc, valid_timing = self._validate(
+                        val_loader, mixed_precision=mixed_precision,
+                        profile=profile)
+
+                if is_rank_zero:
+                    tqdm.write(
+                        "\n Epoch {}:\n"
+                        "Train Loss: {:.6f} | Test Loss: {:.6f} |"
+                        "Train Acc: {:.4f} | Test Acc: {:.4f} |"
+                        "Train samples/s: {:.1f}".format(
+                            self.epoch,
+                            train_loss,
+                            valid_loss,
+                            train_acc,
+                            valid_acc,
+                            train_timing['samples_per_sec']))
 
                 self.record['epoch'].append(self.epoch)
                 self.record['train_error'].append(train_loss)
                 self.record['train_accuracy'].append(train_acc)
                 self.record['validation_error'].append(valid_loss)
                 self.record['validation_accuracy'].append(valid_acc)
+                # Networks pickled before timing was recorded lack these
+                self.record.setdefault('train_samples_per_sec', []).append(
+                    train_timing['samples_per_sec'])
+                self.record.setdefault(
+                    'validation_samples_per_sec', []).append(
+                        valid_timing['samples_per_sec'])
+                self.record.setdefault('train_phase_times', []).append(
+                    train_timing['phase_times'])
+                self.record.setdefault('validation_phase_times', []).append(
+                    valid_timing['phase_times'])
+
+                if is_rank_zero:
+                    self._call_epoch_hooks()
 
                 if plot:
                     plt.ion()
@@ -596,65 +1229,339 @@ class BaseNetwork(nn.Module):
                     display_record(record=self.record)
                 self.epoch += 1
 
+                if writer:
+                    now = time.time()
+                    if (checkpoint_interv and
+                            (epoch + 1) % checkpoint_interv == 0) or \
+                            (checkpoint_secs and
+                             now - last_checkpoint_time >= checkpoint_secs):
+                        writer.submit(self._snapshot_checkpoint())
+                        last_checkpoint_time = now
+
+                # Only consult the stopping rule on validation epochs.
+                stop = False
+                if stopper and epoch % valid_interv == 0:
+                    stop = stopper.step(self)
+                    if stop:
+                        logger.info(
+                            "Early stopping at epoch {}: no {} improvement "
+                            "in {} validation checks.".format(
+                                self.epoch - 1, stopper.monitor,
+                                stopper.patience + 1))
+                # Every rank has to leave the loop together, whether rank 0
+                # stopped early or any rank was interrupted.
+                if self._is_distributed():
+                    flags = torch.tensor(
+                        [int(stop), int(deferred_interrupt.interrupted)])
+                    dist.all_reduce(flags, op=dist.ReduceOp.MAX)
+                    stop = bool(flags[0].item())
+                    if flags[1].item():
+                        raise KeyboardInterrupt
+                if stop:
+                    break
+
         except KeyboardInterrupt:
 
             logger.warning(
                 "\n\n**********KeyboardInterrupt: "
                 "Training stopped prematurely.**********\n\n")
 
-    def _train_epoch(self, train_loader, retain_graph):
+        finally:
+            deferred_interrupt.stop()
+
+        # Nothing to restore if no epoch was validated yet
+        if stopper and stopper.best_epoch is not None:
+            logger.info("Restoring weights from epoch {}.".format(
+                stopper.best_epoch))
+            stopper.restore(self)
+
+        if writer:
+            # Waits for the last checkpoint to finish writing.
+            writer.close()
+
+    @staticmethod
+    def _is_distributed():
+        return dist.is_available() and dist.is_initialized()
+
+    @staticmethod
+    def _get_rank():
+        """Return the distributed rank of this process, 0 if not distributed."""
+        if BaseNetwork._is_distributed():
+            return dist.get_rank()
+        return 0
+
+    def _all_reduce_gradients(self):
+        """Average gradients across all processes in a single all-reduce."""
+        grads = [p.grad for p in self.parameters() if p.grad is not None]
+        if not grads:
+            return
+        flat_grads = torch.cat([g.view(-1) for g in grads])
+        dist.all_reduce(flat_grads)
+        flat_grads /= dist.get_world_size()
+        offset = 0
+        for g in grads:
+            g.copy_(flat_grads[offset:offset + g.numel()].view_as(g))
+            offset += g.numel()
+
+    def _fit_distributed(self, workers, train_loader, val_loader, epochs,
+                         **fit_kwargs):
         """
-        Trains the network for 1 epoch.
+        Train with `workers` local processes on the gloo backend.
+
+        This process becomes rank 0 and trains self directly so the record,
+        weights and optimizer state are where the caller expects them.
+        The other ranks train copies of the network and exit when done.
 
         Parameters
         ----------
+        workers : int
+            The total number of processes, including this one.
         train_loader : DataLoader
-            The DataLoader object containing the dataset to train on.
+            The DataLoader object containing the training data.
+            It is sharded with a DistributedSampler in every process.
+        val_loader : DataLoader
+            The DataLoader object containing the validation data.
+            Only used by rank 0.
+        epochs : int
+            The number of epochs to train for.
+        fit_kwargs : dict
+            The remaining fit arguments.
 
         Returns
         -------
-        (train_loss, train_accuracy) : (float, float)
-            Returns the train loss and accuracy.
+        None
 
         """
-        self.train()  # Set model to training mode
+        if self.device.type != 'cpu':
+            raise ValueError(
+                "Multi-process training only supports cpu networks, "
+                "got {}.".format(self.device))
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            init_method = 'tcp://127.0.0.1:{}'.format(sock.getsockname()[1])
+
+        # Pickle up front so workers get their own copy of the weights
+        # instead of sharing storage with this process.
+        network_bytes = pickle.dumps(self, 2)
+        worker_kwargs = dict(fit_kwargs, plot=False, checkpoint_path=None)
+        ctx = mp.get_context('spawn')
+        processes = []
+        for rank in range(1, workers):
+            process = ctx.Process(
+                target=_fit_worker,
+                args=(network_bytes, rank, workers, init_method,
+                      train_loader, epochs, worker_kwargs),
+                daemon=True)
+            process.start()
+            processes.append(process)
+
+        num_threads = torch.get_num_threads()
+        try:
+            _fit_rank(self, 0, workers, init_method,
+                      train_loader, val_loader, epochs, fit_kwargs)
+        finally:
+            torch.set_num_threads(num_threads)
+            # Ranks leave fit together, so a worker still running past the
+            # timeout is stuck on a peer that failed.
+            deadline = time.time() + _WORKER_JOIN_TIMEOUT
+            for process in processes:
+                process.join(max(0, deadline - time.time()))
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+        failed = [p.exitcode for p in processes if p.exitcode != 0]
+        if failed:
+            raise RuntimeError(
+                "{} training worker(s) exited with errors: {}".format(
+                    len(failed), failed))
+
+    def register_epoch_hook(self, hook):
+        """
+        Register a hook called by fit at the end of every epoch.
+
+        The hook should have the following signature::
+
+            hook(network, epoch_record) -> None
+
+        where epoch_record holds the latest value of every self.record
+        entry, including samples/sec and the seconds spent per phase.
+        Useful for shipping training metrics to external monitoring.
+
+        Parameters
+        ----------
+        hook : callable
+            The hook to register.
+
+        Returns
+        -------
+        handle : torch.utils.hooks.RemovableHandle
+            A handle that can be used to remove the hook with
+            handle.remove().
+
+        """
+        if getattr(self, '_epoch_hooks', None) is None:
+            self._epoch_hooks = OrderedDict()
+        handle = RemovableHandle(self._epoch_hooks)
+        self._epoch_hooks[handle.id] = hook
+        return handle
+
+    def _call_epoch_hooks(self):
+        hooks = getattr(self, '_epoch_hooks', None)
+        if not hooks:
+            return
+        epoch_record = {k: v[-1] for k, v in self.record.items() if v}
+        for hook in list(hooks.values()):
+            hook(self, epoch_record)
+
+    def _snapshot_checkpoint(self):
+        """
+        Copy everything needed to resume training.
+
+        Only tensors are cloned so this stays cheap on the training thread;
+        serialization is left to the CheckpointWriter.
+
+        Returns
+        -------
+        checkpoint : dict
+
+        """
+        return dict(
+            epoch=self.epoch,
+            record=copy.deepcopy(self.record),
+            state_dict=clone_tensors(self.state_dict()),
+            optimizer=clone_tensors(self.optim.state_dict()))
+
+    def load_checkpoint(self, checkpoint_path):
+        """
+        Resume from a checkpoint written during fit.
+
+        Restores the weights, optimizer state, epoch and record.
+
+        Parameters
+        ----------
+        checkpoint_path : str
+            The checkpoint directory given to fit, or the checkpoint file.
+
+        Returns
+        -------
+        None
+
+        """
+        if os.path.isdir(checkpoint_path):
+            checkpoint_path = os.path.join(checkpoint_path, 'checkpoint.pt')
+        checkpoint = torch.load(checkpoint_path, map_location=self.device)
+        self.load_state_dict(checkpoint['state_dict'])
+        self.clear_embedding_cache()
+        if self.optim is None:
+            self._init_trainer()
+        self.optim.load_state_dict(checkpoint['optimizer'])
+        self.epoch = checkpoint['epoch']
+        self.record = checkpoint['record']
 
-        train_loss_accumulator = 0.0
-        train_accuracy_accumulator = 0.0
-        pbar = trange(len(train_loader.dataset), desc='Training.. ')
+    def _train_epoch(self, train_loader, retain_graph, mixed_precision=False,
+                     accumulate_steps=1, profile=False):
+        """
+        Trains the network for 1 epoch.
 
-        for data, targets in train_loader:
+        Parameters
+        ----------
+        train_loader : DataLoader
+            The DataLoader object containing the dataset to train on.
+        retain_graph : {None, True, False}
+            Whether retain_graph will be true when .backwards is called.
+        mixed_precision : boolean
+            Whether to run the forward pass and loss under bfloat16 autocast.
+        accumulate_steps : int
+            The number of micro-batches to split each batch into.
+        profile : boolean
+            Whether to synchronize the device after every phase so
+            phase times are exact on accelerators.
 
-            data = set_tensor_device(data, device=self.device)
-            targets = set_tensor_device(targets, device=self.device)
+        Returns
+        -------
+        (train_loss, train_accuracy, timing) : (float, float, dict)
+            Returns the train loss and accuracy, and the samples/sec and
+            seconds spent per phase.
+
+        """
+        self.train()  # Set model to training mode
 
-            # Forward + Backward + Optimize
-            predictions = self(data)
-            train_loss = self.criterion(predictions, targets)
-            train_loss_accumulator += train_loss.item()
+        accumulator = MetricAccumulator(
+            num_classes=self._num_classes, device=self.device)
+        timer = PhaseTimer(self.device if profile else None)
+        pbar = trange(len(train_loader.sampler), desc='Training.. ',
+                      disable=self._get_rank() != 0)
+
+        embedding_caches = self._get_embedding_caches(train_loader.dataset)
+        if embedding_caches:
+            train_loader = index_data_loader(train_loader)
+
+        # Batches arrive already on self.device
+        prefetcher = DataPrefetcher(train_loader, self.device)
+        batches = iter(prefetcher)
+        while True:
+            with timer.phase('data_wait'):
+                batch = next(batches, None)
+            if batch is None:
+                break
+            data, targets = batch[:2]
+            if embedding_caches:
+                micro_indices = split_batch(batch[2], accumulate_steps)
+            else:
+                micro_indices = [None] * accumulate_steps
 
+            batch_size = len(targets)
             self.optim.zero_grad()
-            train_loss.backward(retain_graph=retain_graph)
-            self.optim.step()
-            metric = "accuracy"
-            # will be fixed in the future
-            train_accuracy_accumulator += self.metrics.get_score(
-                targets=targets,
-                predictions=predictions,
-                metrics=metric)[metric]
-
-            pbar.update(train_loader.batch_size)
+            for micro_data, micro_targets, micro_keys in zip(
+                    split_batch(data, accumulate_steps),
+                    split_batch(targets, accumulate_steps),
+                    micro_indices):
+                # Smaller batches than accumulate_steps leave empty chunks
+                if len(micro_targets) == 0:
+                    continue
+
+                # Forward + Backward
+                with self._autocast(enabled=mixed_precision):
+                    with timer.phase('forward'):
+                        predictions = self(
+                            micro_data, embedding_caches=embedding_caches,
+                            cache_keys=micro_keys)
+                    with timer.phase('loss'):
+                        train_loss = self.criterion(
+                            predictions, micro_targets)
+
+                # Weight each micro-batch by its share of the batch so the
+                # summed gradients equal those of the whole batch.
+                with timer.phase('backward'):
+                    micro_loss = train_loss * len(micro_targets) / batch_size
+                    micro_loss.backward(retain_graph=retain_graph)
+
+                # Kept on device, only read back once the epoch is done.
+                with timer.phase('metrics'):
+                    accumulator.update(train_loss, predictions, micro_targets)
+
+            if self._is_distributed():
+                with timer.phase('gradient_sync'):
+                    self._all_reduce_gradients()
+
+            # Optimize
+            with timer.phase('optimizer'):
+                self.optim.step()
+
+            pbar.update(batch_size)
         pbar.close()
 
-        train_loss = train_loss_accumulator * \
-            train_loader.batch_size / len(train_loader.dataset)
-        train_accuracy = train_accuracy_accumulator * \
-            train_loader.batch_size / len(train_loader.dataset)
+        with timer.phase('metrics'):
+            if self._is_distributed():
+                accumulator.all_reduce()
+            train_loss, train_accuracy = accumulator.compute()
 
-        return train_loss, train_accuracy
+        timer.split('data_wait', 'transfer', prefetcher.transfer_time)
+        return train_loss, train_accuracy, timer.summary(accumulator.n_samples)
 
     @torch.no_grad()
-    def _validate(self, val_loader):
+    def _validate(self, val_loader, mixed_precision=False, profile=False):
         """
         Validate the network on the validation data.
 
@@ -662,56 +1569,167 @@ class BaseNetwork(nn.Module):
         ----------
         val_loader : DataLoader
             The DataLoader object containing the dataset to evaluate on
+        mixed_precision : boolean
+            Whether to run the forward pass and loss under bfloat16 autocast.
+        profile : boolean
+            Whether to synchronize the device after every phase so
+            phase times are exact on accelerators.
 
         Returns
         -------
-        (val_loss, val_accuracy) : (float, float)
-            Returns the validation loss and accuracy
+        (val_loss, val_accuracy, timing) : (float, float, dict)
+            Returns the validation loss and accuracy, and the samples/sec
+            and seconds spent per phase.
 
         """
         self.eval()  # Set model to evaluate mode
 
-        val_loss_accumulator = 0.0
-        val_accuracy_accumulator = 0.0
+        accumulator = MetricAccumulator(
+            num_classes=self._num_classes, device=self.device)
+        timer = PhaseTimer(self.device if profile else None)
         pbar = trange(len(val_loader.dataset), desc='Validating.. ')
 
-        for data, targets in val_loader:
+        embedding_caches = self._get_embedding_caches(val_loader.dataset)
+        if embedding_caches:
+            val_loader = index_data_loader(val_loader)
+
+        # Batches arrive already on self.device
+        prefetcher = DataPrefetcher(val_loader, self.device)
+        batches = iter(prefetcher)
+        while True:
+            with timer.phase('data_wait'):
+                batch = next(batches, None)
+            if batch is None:
+                break
+            data, targets = batch[:2]
+            indices = batch[2] if embedding_caches else None
+
+            with self._autocast(enabled=mixed_precision):
+                with timer.phase('forward'):
+                    predictions = self(
+                        data, embedding_caches=embedding_caches,
+                        cache_keys=indices)
+                with timer.phase('loss'):
+                    validation_loss = self.criterion(predictions, targets)
+            with timer.phase('metrics'):
+                accumulator.update(validation_loss, predictions, targets)
+
+            pbar.update(len(targets))
+        pbar.close()
 
-            data = set_tensor_device(data, device=self.device)
-            targets = set_tensor_device(targets, device=self.device)
+        with timer.phase('metrics'):
+            validation_loss, validation_accuracy = accumulator.compute()
 
-            predictions = self(data)
-            validation_loss = self.criterion(predictions, targets)
-            val_loss_accumulator += validation_loss.item()
+        timer.split('data_wait', 'transfer', prefetcher.transfer_time)
+        return validation_loss, validation_accuracy, \
+            timer.summary(accumulator.n_samples)
 
-            # Will fix this in the future
-            metric = "accuracy"
-            val_accuracy_accumulator += self.metrics.get_score(
-                targets=targets,
-                predictions=predictions,
-                metrics=metric)[metric]
+    def find_lr(self, train_loader, start=1e-7, end=10, num_steps=100,
+                smoothing=0.98, diverge_factor=4, retain_graph=None):
+        """
+        Run a learning rate range test.
 
-            pbar.update(val_loader.batch_size)
-        pbar.close()
+        Trains with a fresh optimizer from optim_spec while growing the
+        learning rate exponentially from start to end, one batch per
+        step. The sweep stops early once the loss diverges. The weights
+        (and self.optim, which isn't used) are left as they were.
 
-        validation_loss = val_loss_accumulator * \
-            val_loader.batch_size / len(val_loader.dataset)
-        validation_accuracy = val_accuracy_accumulator * \
-            val_loader.batch_size / len(val_loader.dataset)
+        Parameters
+        ----------
+        train_loader : DataLoader
+            The DataLoader object containing the training data. It is
+            iterated repeatedly if it has fewer than num_steps batches.
+        start : float
+            The learning rate of the first step.
+        end : float
+            The learning rate of the last step.
+        num_steps : int
+            The number of learning rates to try.
+        smoothing : float between 0-1
+            Exponential moving average factor applied to the loss.
+        diverge_factor : float
+            Stop once the smoothed loss exceeds the best one by this factor.
+        retain_graph : {None, True, False}
+            Whether retain_graph will be true when .backwards is called.
 
-        return validation_loss, validation_accuracy
+        Returns
+        -------
+        (suggested_lr, lr_record) : (float, dict)
+            The learning rate at which the smoothed loss fell fastest, and
+            the tried learning rates with their smoothed losses.
 
-    def run_test(self, data_loader, figure_path=None, plot=False):
+        """
+        if num_steps < 2:
+            raise ValueError("num_steps must be >= 2.")
+        if len(train_loader) == 0:
+            raise ValueError("train_loader must not be empty.")
+
+        initial_state = clone_tensors(self.state_dict())
+        was_training = self.training
+        optim = self._init_optimizer(self._optim_spec)
+        criterion = self.criterion or self._init_criterion(self._criter_spec)
+        lr_multiplier = (end / start) ** (1 / (num_steps - 1))
+
+        lr_record = dict(lr=[], loss=[])
+        avg_loss = 0.0
+        best_loss = np.inf
+
+        def cycle_batches():
+            while True:
+                for batch in DataPrefetcher(train_loader, self.device):
+                    yield batch
+
+        self.train()
+        try:
+            for step, (data, targets) in zip(range(num_steps),
+                                             cycle_batches()):
+                lr = start * lr_multiplier ** step
+                for param_group in optim.param_groups:
+                    param_group['lr'] = lr
+
+                loss = criterion(self(data), targets)
+                optim.zero_grad()
+                loss.backward(retain_graph=retain_graph)
+                optim.step()
+
+                # Bias corrected exponential moving average
+                avg_loss = smoothing * avg_loss + \
+                    (1 - smoothing) * loss.item()
+                smoothed_loss = avg_loss / (1 - smoothing ** (step + 1))
+                lr_record['lr'].append(lr)
+                lr_record['loss'].append(smoothed_loss)
+
+                best_loss = min(best_loss, smoothed_loss)
+                if smoothed_loss > diverge_factor * best_loss or \
+                        np.isnan(smoothed_loss):
+                    break
+        finally:
+            self.load_state_dict(initial_state)
+            self.train(was_training)
+
+        losses = np.array(lr_record['loss'])
+        if len(losses) < 2:
+            return lr_record['lr'][0], lr_record
+        # Steepest descent of the loss against log learning rate
+        gradients = np.gradient(losses, np.log(lr_record['lr']))
+        suggested_lr = lr_record['lr'][int(np.nanargmin(gradients))]
+        logger.info("Suggested learning rate: {:.2e}".format(suggested_lr))
+        return suggested_lr, lr_record
+
+    def run_test(self, data_loader, figure_path=None, plot=False,
+                 auc_bins=None):
         """Will conduct the test suite to determine model strength."""
         return self.metrics.run_test(
             network=self,
             data_loader=data_loader,
             figure_path=figure_path,
-            plot=plot)
+            plot=plot,
+            auc_bins=auc_bins)
 
     def cross_validate(self, data_loader, k, epochs,
                        average_results=True, retain_graph=None,
-                       valid_interv=4, plot=False, figure_path=None):
+                       valid_interv=4, plot=False, figure_path=None,
+                       n_jobs=1, cache_dir=None):
         """Will conduct the test suite to determine model strength."""
         # TODO: deal with repeated default parameters
         return self.metrics.cross_validate(
@@ -723,10 +1741,122 @@ class BaseNetwork(nn.Module):
             retain_graph=retain_graph,
             valid_interv=valid_interv,
             plot=plot,
-            figure_path=figure_path)
+            figure_path=figure_path,
+            n_jobs=n_jobs,
+            cache_dir=cache_dir)
 
     @torch.no_grad()
-    def forward_pass(self, data_loader, convert_to_class=False):
+    def iter_forward_pass(self, data_loader, convert_to_class=False,
+                          mixed_precision=False, top_k=None, threshold=None,
+                          return_targets=False):
+        """
+        Pass data through the network, yielding one batch at a time.
+
+        Use this instead of forward_pass to stream outputs for datasets
+        too large to hold in memory at once.
+
+        Parameters
+        ----------
+        data_loader : DataLoader
+            DataLoader object to make the pass with.
+        convert_to_class : boolean
+            If true, list of class predictions instead of class probabilites.
+        top_k : int or None
+            If set, the top_k most probable classes and their
+            probabilities, most probable first.
+        threshold : float or None
+            If set, whether each class probability is >= threshold, e.g.
+            for a decision threshold other than argmax.
+        mixed_precision : boolean
+            Whether to run the forward pass under bfloat16 autocast.
+            Outputs are always returned as float32.
+        return_targets : boolean
+            Whether to also yield the targets of each batch.
+
+        Yields
+        ------
+        outputs : numpy.ndarray or tuple of numpy.ndarray
+            Numpy matrix with the output of one batch, or the
+            (classes, probabilities) pair with top_k.
+            With return_targets, the (outputs, targets) pair.
+
+        """
+        self._check_output_kwargs(convert_to_class, top_k, threshold)
+        self.eval()
+        for data, targets in DataPrefetcher(data_loader, self.device):
+            # Get raw network output
+            with self._autocast(enabled=mixed_precision):
+                predictions = self(data)
+            predictions = self._convert_predictions(
+                predictions.float(), convert_to_class=convert_to_class,
+                top_k=top_k, threshold=threshold)
+            # The only copy to the host, once the outputs are final
+            if isinstance(predictions, tuple):
+                predictions = tuple(p.cpu().numpy() for p in predictions)
+            else:
+                predictions = predictions.cpu().numpy()
+            if return_targets:
+                yield predictions, torch.as_tensor(targets).cpu().numpy()
+            else:
+                yield predictions
+
+    def _check_output_kwargs(self, convert_to_class, top_k, threshold):
+        """Validate the forward_pass output options."""
+        if sum([bool(convert_to_class), top_k is not None,
+                threshold is not None]) > 1:
+            raise ValueError(
+                "Only one of convert_to_class, top_k and threshold can be "
+                "used at a time.")
+        if (top_k is not None or threshold is not None) and \
+                not self._num_classes:
+            raise ValueError(
+                "top_k and threshold require a network with num_classes.")
+        if top_k is not None and not 1 <= top_k <= self.out_dim[0]:
+            raise ValueError(
+                "top_k must be between 1 and {}.".format(self.out_dim[0]))
+
+    def _convert_predictions(self, predictions, convert_to_class=False,
+                             top_k=None, threshold=None):
+        """
+        Turn raw network outputs into the requested outputs, on device.
+
+        Parameters
+        ----------
+        predictions : torch.Tensor
+            The raw network outputs of one batch.
+        convert_to_class : boolean
+            If true, list of class predictions instead of class probabilites.
+        top_k : int or None
+            If set, the top_k most probable classes and their
+            probabilities, most probable first.
+        threshold : float or None
+            If set, whether each class probability is >= threshold, e.g.
+            for a decision threshold other than argmax.
+
+        Returns
+        -------
+        outputs : torch.Tensor or tuple of torch.Tensor
+
+        """
+        if not self._num_classes:
+            return predictions
+        if convert_to_class and predictions.shape[1] > 1:
+            # Softmax doesn't change the argmax
+            return predictions.argmax(dim=1)
+        # Get probabilities
+        predictions = nn.Softmax(dim=1)(predictions)
+        if convert_to_class:
+            return MetricAccumulator.extract_class_labels(predictions)
+        if top_k is not None:
+            probabilities, classes = predictions.topk(top_k, dim=1)
+            return classes, probabilities
+        if threshold is not None:
+            return predictions >= threshold
+        return predictions
+
+    def forward_pass(self, data_loader, convert_to_class=False,
+                     mixed_precision=False, workers=1, top_k=None,
+                     threshold=None, return_targets=False):
         """
         Allow the user to pass data through the network.
 
@@ -736,32 +1866,318 @@ class BaseNetwork(nn.Module):
             DataLoader object to make the pass with.
         convert_to_class : boolean
             If true, list of class predictions instead of class probabilites.
+        top_k : int or None
+            If set, the top_k most probable classes and their
+            probabilities, most probable first.
+        threshold : float or None
+            If set, whether each class probability is >= threshold, e.g.
+            for a decision threshold other than argmax.
+        mixed_precision : boolean
+            Whether to run the forward pass under bfloat16 autocast.
+            Outputs are always returned as float32.
+        workers : int
+            The number of local processes to split the dataset between,
+            cpu networks only. Each scores a contiguous index range, with
+            the weights and outputs in shared memory, and this process
+            scores the first range. data_loader must not shuffle.
+            Scripts using this must guard their entry point with
+            `if __name__ == '__main__':`.
+        return_targets : boolean
+            Whether to also return the targets, collected from the same
+            batches as the outputs instead of a second dataset pass.
 
         Returns
         -------
-        outputs : numpy.ndarray
+        outputs : numpy.ndarray or tuple of numpy.ndarray
             Numpy matrix with the output. Same shape as network out_dim.
+            With top_k, the (classes, probabilities) pair.
+            With return_targets, the (outputs, targets) pair.
 
         """
-        self.eval()
-        # prediction_shape used to aggregate network outputs
-        # (e.g. with or without class conversion)
-        dtype = torch.long if convert_to_class else torch.float
-        pred_collector = torch.tensor([], dtype=dtype, device=self.device)
-        for data, _ in data_loader:
-            # Get raw network output
-            predictions = self(data)
-            if self._num_classes:
-                # Get probabilities
-                predictions = nn.Softmax(dim=1)(predictions)
-                if convert_to_class:
-                    predictions = torch.tensor(
-                        self.metrics.extract_class_labels(
-                            in_matrix=predictions),
-                        device=self.device)
-            # Aggregate predictions
-            pred_collector = torch.cat([pred_collector, predictions])
-        return pred_collector.cpu().numpy()
+        forward_kwargs = dict(
+            convert_to_class=convert_to_class,
+            mixed_precision=mixed_precision,
+            top_k=top_k,
+            threshold=threshold,
+            return_targets=return_targets)
+        self._check_output_kwargs(convert_to_class, top_k, threshold)
+        output_spec = self._get_output_spec(convert_to_class, top_k, threshold)
+        if return_targets:
+            output_spec.append(self._get_target_spec(data_loader))
+        if workers > 1:
+            outputs = self._forward_pass_sharded(
+                data_loader, workers, output_spec, **forward_kwargs)
+        else:
+            # Allocate the outputs once instead of concatenating batches
+            n_samples = self._get_n_loader_samples(data_loader)
+            outputs = [
+                np.empty([n_samples, *row_shape], dtype=dtype)
+                for row_shape, dtype in output_spec]
+            n_filled = self._write_forward_pass(
+                outputs, data_loader, **forward_kwargs)
+            # Batch samplers may drop the last incomplete batch
+            outputs = [o[:n_filled] for o in outputs]
+        targets = outputs.pop() if return_targets else None
+        outputs = tuple(outputs) if top_k is not None else outputs[0]
+        return (outputs, targets) if return_targets else outputs
+
+    def _get_output_spec(self, convert_to_class=False, top_k=None,
+                         threshold=None):
+        """Return the row shape and numpy dtype name of each output."""
+        if not self._num_classes:
+            return [(list(self.out_dim), 'float32')]
+        if convert_to_class:
+            return [([], 'int64')]
+        if top_k is not None:
+            return [([top_k], 'int64'), ([top_k], 'float32')]
+        if threshold is not None:
+            return [(list(self.out_dim), 'bool')]
+        return [(list(self.out_dim), 'float32')]
+
+    @staticmethod
+    def _get_n_loader_samples(data_loader):
+        """Return how many samples data_loader yields at most."""
+        # Samplers drawing with replacement may yield more samples
+        # than the dataset holds.
+        sampler = getattr(data_loader.batch_sampler, 'sampler',
+                          data_loader.sampler)
+        try:
+            return len(sampler)
+        except TypeError:
+            return len(data_loader.dataset)
+
+    @staticmethod
+    def _get_target_spec(data_loader):
+        """Return the row shape and numpy dtype name of the targets."""
+        if len(data_loader.dataset) == 0:
+            return [], 'int64'
+        # Collate one sample so the dtype matches the batched targets
+        _, target = data_loader.collate_fn([data_loader.dataset[0]])
+        target = torch.as_tensor(target)
+        return list(target.shape[1:]), str(target.dtype).split('.')[-1]
+
+    def _write_forward_pass(self, outputs, data_loader, **forward_kwargs):
+        """Write the forward_pass of data_loader into outputs, in order."""
+        n_filled = 0
+        for predictions in self.iter_forward_pass(
+                data_loader, **forward_kwargs):
+            if forward_kwargs.get('return_targets'):
+                predictions, targets = predictions
+            if not isinstance(predictions, tuple):
+                predictions = (predictions,)
+            if forward_kwargs.get('return_targets'):
+                predictions += (targets,)
+            for output, prediction in zip(outputs, predictions):
+                output[n_filled:n_filled + len(prediction)] = prediction
+            n_filled += len(predictions[0])
+        return n_filled
+
+    def _forward_pass_sharded(self, data_loader, workers, output_spec,
+                              **forward_kwargs):
+        """
+        Run forward_pass with `workers` local processes.
+
+        Parameters
+        ----------
+        data_loader : DataLoader
+            DataLoader object to make the pass with.
+        workers : int
+            The total number of processes, including this one.
+        output_spec : list of (list, str)
+            The row shape and dtype name of each output.
+        forward_kwargs : dict
+            The remaining forward_pass arguments.
+
+        Returns
+        -------
+        outputs : list of numpy.ndarray
+            The outputs of all processes, in dataset order.
+
+        """
+        if self.device.type != 'cpu':
+            raise ValueError(
+                "Multi-process forward_pass only supports cpu networks, "
+                "got {}.".format(self.device))
+        if not isinstance(data_loader.sampler, SequentialSampler):
+            raise ValueError(
+                "Multi-process forward_pass requires a DataLoader without "
+                "shuffling.")
+        n_samples = len(data_loader.dataset)
+        # Workers receive handles to these instead of pickled copies
+        outputs = [
+            torch.empty([n_samples, *row_shape],
+                        dtype=getattr(torch, dtype)).share_memory_()
+            for row_shape, dtype in output_spec]
+        # Share a copy so the caller's parameters stay where they are
+        shared_network = copy.deepcopy(self).share_memory()
+
+        bounds = np.linspace(0, n_samples, workers + 1).astype(int)
+        loader_kwargs = dict(
+            batch_size=data_loader.batch_size,
+            collate_fn=data_loader.collate_fn,
+            num_workers=data_loader.num_workers,
+            pin_memory=data_loader.pin_memory,
+            worker_init_fn=data_loader.worker_init_fn,
+            timeout=data_loader.timeout)
+        num_threads = max(1, (os.cpu_count() or 1) // workers)
+        ctx = mp.get_context('spawn')
+        processes = []
+        for start, stop in zip(bounds[1:-1], bounds[2:]):
+            # Not daemonic, so workers can start their own loader workers
+            process = ctx.Process(
+                target=_forward_pass_worker,
+                args=(shared_network, data_loader.dataset, start, stop,
+                      loader_kwargs, outputs, forward_kwargs, num_threads))
+            process.start()
+            processes.append(process)
+
+        caller_threads = torch.get_num_threads()
+        try:
+            _forward_pass_worker(
+                self, data_loader.dataset, bounds[0], bounds[1],
+                loader_kwargs, outputs, forward_kwargs, num_threads)
+        finally:
+            torch.set_num_threads(caller_threads)
+            for process in processes:
+                process.join()
+        failed = [p.exitcode for p in processes if p.exitcode != 0]
+        if failed:
+            raise RuntimeError(
+                "{} forward_pass worker(s) exited with errors: {}".format(
+                    len(failed), failed))
+        return [o.numpy() for o in outputs]
+
+    def score_to_disk(self, data_loader, path, shard_size=None,
+                      convert_to_class=False, mixed_precision=False):
+        """
+        Pass data through the network, writing the outputs to disk.
+
+        Outputs are written as batches complete, so memory use doesn't
+        grow with the dataset. With shard_size=None they go into a
+        single memory-mapped predictions.npy; otherwise into a series
+        of shard_XXXXX.npy files of shard_size rows each. Progress is
+        recorded in path/manifest.json, and calling score_to_disk again
+        with the same arguments resumes after the last recorded batch
+        (or shard).
+
+        Parameters
+        ----------
+        data_loader : DataLoader
+            DataLoader object to make the pass with. It must not shuffle
+            so rows line up with the dataset indices.
+        path : str
+            The directory to write the outputs and manifest to.
+        shard_size : int or None
+            The number of rows per .npy shard, or None for a single
+            memory-mapped file.
+        convert_to_class : boolean
+            If true, list of class predictions instead of class probabilites.
+        mixed_precision : boolean
+            Whether to run the forward pass under bfloat16 autocast.
+
+        Returns
+        -------
+        manifest : dict
+            The manifest: the output files, shape, dtype and number of
+            completed rows.
+
+        """
+        if not isinstance(data_loader.sampler, SequentialSampler):
+            raise ValueError(
+                "score_to_disk requires a DataLoader without shuffling.")
+        if shard_size is not None and shard_size < 1:
+            raise ValueError("shard_size must be >= 1.")
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        n_samples = len(data_loader.dataset)
+        (row_shape, dtype), = self._get_output_spec(convert_to_class)
+        manifest = dict(
+            n_samples=n_samples, row_shape=row_shape, dtype=dtype,
+            convert_to_class=convert_to_class, shard_size=shard_size,
+            files=[], n_completed=0)
+
+        manifest_path = os.path.join(path, 'manifest.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                previous = json.load(f)
+            for key in ['n_samples', 'row_shape', 'dtype', 'shard_size']:
+                if previous[key] != manifest[key]:
+                    raise ValueError(
+                        "Can't resume scoring into {}, its {} is {} instead "
+                        "of {}.".format(path, key, previous[key],
+                                        manifest[key]))
+            manifest = previous
+            logger.info("Resuming scoring after {} of {} samples.".format(
+                manifest['n_completed'], n_samples))
+
+        def save_manifest():
+            tmp_path = manifest_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, manifest_path)
+
+        start = manifest['n_completed']
+        if start >= n_samples:
+            return manifest
+        remaining_loader = DataLoader(
+            Subset(data_loader.dataset, range(start, n_samples)),
+            batch_size=data_loader.batch_size,
+            num_workers=data_loader.num_workers,
+            collate_fn=data_loader.collate_fn,
+            pin_memory=data_loader.pin_memory)
+        batches = self.iter_forward_pass(
+            remaining_loader, convert_to_class=convert_to_class,
+            mixed_precision=mixed_precision)
+
+        if shard_size is None:
+            file_name = 'predictions.npy'
+            file_path = os.path.join(path, file_name)
+            if start == 0:
+                outputs = np.lib.format.open_memmap(
+                    file_path, mode='w+', dtype=dtype,
+                    shape=(n_samples, *row_shape))
+                manifest['files'] = [file_name]
+            else:
+                outputs = np.load(file_path, mmap_mode='r+')
+            for predictions in batches:
+                outputs[start:start + len(predictions)] = predictions
+                start += len(predictions)
+                outputs.flush()
+                manifest['n_completed'] = start
+                save_manifest()
+            del outputs
+            return manifest
+
+        # Resume from the first incomplete shard
+        buffer = np.empty([shard_size, *row_shape], dtype=dtype)
+        n_buffered = 0
+        shard_idx = start // shard_size
+
+        def write_shard():
+            file_name = 'shard_{:05d}.npy'.format(shard_idx)
+            # Write then rename so a crash never leaves a partial shard
+            tmp_path = os.path.join(path, file_name + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, buffer[:n_buffered])
+            os.replace(tmp_path, os.path.join(path, file_name))
+            manifest['files'].append(file_name)
+            manifest['n_completed'] += n_buffered
+            save_manifest()
+
+        for predictions in batches:
+            while len(predictions):
+                n_copy = min(shard_size - n_buffered, len(predictions))
+                buffer[n_buffered:n_buffered + n_copy] = predictions[:n_copy]
+                n_buffered += n_copy
+                predictions = predictions[n_copy:]
+                if n_buffered == shard_size:
+                    write_shard()
+                    shard_idx += 1
+                    n_buffered = 0
+        if n_buffered:
+            write_shard()
+        return manifest
 
     def save_model(self, save_path=None):
         """
@@ -831,3 +2247,70 @@ class BaseNetwork(nn.Module):
         instance = pickle.load(open(model_file_path, 'rb'))
 
         return instance
+
+
+def _autocast_state(device_type):
+    """
+    Return whether autocast is enabled for device_type and its dtype.
+
+    The dtype is None when autocast is disabled. The device_type
+    arguments of is_autocast_enabled and get_autocast_dtype are only
+    available from torch 2.4, so older versions use the per-device
+    functions instead.
+
+    """
+    if hasattr(torch, 'get_autocast_dtype'):
+        if not torch.is_autocast_enabled(device_type):
+            return False, None
+        return True, torch.get_autocast_dtype(device_type)
+    if device_type == 'cpu':
+        if not torch.is_autocast_cpu_enabled():
+            return False, None
+        return True, torch.get_autocast_cpu_dtype()
+    if not torch.is_autocast_enabled():
+        return False, None
+    return True, torch.get_autocast_gpu_dtype()
+
+
+def _forward_branch(network, inputs, grad_enabled, device_type,
+                    autocast_enabled, autocast_dtype):
+    """Run an input network on a pool thread in the caller's modes."""
+    with torch.set_grad_enabled(grad_enabled), \
+            torch.autocast(device_type=device_type, dtype=autocast_dtype,
+                           enabled=autocast_enabled):
+        return network(inputs)
+
+
+def _fit_rank(network, rank, world_size, init_method,
+              train_loader, val_loader, epochs, fit_kwargs):
+    """Join the process group and fit network on this rank's shard."""
+    dist.init_process_group(
+        'gloo', init_method=init_method, rank=rank, world_size=world_size)
+    # Split the cores between processes instead of oversubscribing them.
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+    try:
+        network.fit(
+            shard_data_loader(train_loader, rank, world_size),
+            val_loader, epochs, **fit_kwargs)
+    finally:
+        dist.destroy_process_group()
+
+
+def _fit_worker(network_bytes, rank, world_size, init_method,
+                train_loader, epochs, fit_kwargs):
+    """Entry point of the non-zero ranks spawned by fit(workers=N)."""
+    network = pickle.loads(network_bytes)
+    _fit_rank(network, rank, world_size, init_method,
+              train_loader, None, epochs, fit_kwargs)
+
+
+def _forward_pass_worker(network, dataset, start, stop, loader_kwargs,
+                         outputs, forward_kwargs, num_threads):
+    """Score dataset[start:stop] into the shared outputs."""
+    # Split the cores between processes instead of oversubscribing them.
+    torch.set_num_threads(num_threads)
+    data_loader = DataLoader(
+        Subset(dataset, range(start, stop)), **loader_kwargs)
+    network._write_forward_pass(
+        [o[start:stop].numpy() for o in outputs], data_loader,
+        **forward_kwargs)
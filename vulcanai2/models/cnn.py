@@ -2,11 +2,12 @@
 """Defines the ConvNet class."""
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import numpy as np
 
 from .basenetwork import BaseNetwork
 from .layers import DenseUnit, ConvUnit, FlattenUnit
-from .utils import pad
+from .utils import get_padding
 
 import logging
 from inspect import getfullargspec
@@ -109,8 +110,10 @@ class ConvNet(BaseNetwork):
         A dictionary of parameters for the desired optimizer.
     lr_scheduler : torch.optim.lr_scheduler
         A callable torch.optim.lr_scheduler
-    early_stopping : str or None
-        So far just 'best_validation_error' is implemented.
+    early_stopping : str, dict or None
+        Either 'best_validation_error' or 'best_validation_accuracy', or a
+        dict with that rule as 'name' and optional 'patience' and
+        'min_delta'. The best weights are restored at the end of fit.
     criter_spec : dict
         criterion specification with name and all its parameters.
 
@@ -173,24 +176,58 @@ class ConvNet(BaseNetwork):
                     out_features=self._num_classes,
                     activation=kwargs['pred_activation']))
 
+    def _get_in_dim(self):
+        """Plan how to merge the input networks, then get the in_dim."""
+        self._merge_plan = self._build_merge_plan()
+        return super(ConvNet, self)._get_in_dim()
+
     def _merge_input_network_outputs(self, tensors):
         """Calculate converged in_dim for the MultiInput ConvNet."""
+        # Networks pickled before merge plans existed build one here.
+        merge_plan = getattr(self, '_merge_plan', None) or \
+            self._build_merge_plan()
         reshaped_tensors = []
+        for t, (in_shape, padding, out_shape) in zip(tensors, merge_plan):
+            if in_shape is not None:
+                t = t.reshape(-1, *in_shape)
+            if padding is not None:
+                t = F.pad(t, padding)
+            if out_shape is not None:
+                t = t.reshape(-1, *out_shape)
+            reshaped_tensors.append(t)
+        return torch.cat(reshaped_tensors, dim=1)
+
+    def _build_merge_plan(self):
+        """
+        Precompute how to cast each input network output for merging.
+
+        Shapes are fixed once the input networks are, so this is done
+        when they are added instead of on every forward pass.
+
+        Returns
+        -------
+        merge_plan : list of tuple
+            For each input network, the (shape to reshape to before
+            padding, F.pad amounts, shape to reshape to after padding),
+            each None when not needed. Shapes exclude the batch.
+
+        """
         # Determine what shape to cast to without losing any information.
         max_conv_tensor_size = self._get_max_incoming_spatial_dims()
-        for t in tensors:
-            if t.dim() == 2:
+        merge_plan = []
+        for in_net in self.input_networks.values():
+            if len(in_net.out_dim) == 1:
                 # Cast Linear output to largest Conv output shape
-                t = self._cast_linear_to_shape(
-                    tensor=t,
+                step = self._plan_linear_cast(
+                    in_shape=in_net.out_dim,
                     cast_shape=max_conv_tensor_size)
-            elif t.dim() > 2:
+            else:
                 # Cast Conv output to largest Conv output shape
-                t = self._cast_conv_to_shape(
-                    tensor=t,
+                step = self._plan_conv_cast(
+                    in_shape=in_net.out_dim,
                     cast_shape=max_conv_tensor_size)
-            reshaped_tensors.append(t)
-        return torch.cat(reshaped_tensors, dim=1)
+            merge_plan.append(step)
+        return merge_plan
 
     def _get_max_incoming_spatial_dims(self):
         """Return the max spatial dimensions of the input networks."""
@@ -212,66 +249,63 @@ class ConvNet(BaseNetwork):
         max_conv_tensor_size = np.array(spatial_inputs).transpose().max(axis=1)
         return np.array(max_conv_tensor_size)
 
-    def _cast_linear_to_shape(self, tensor, cast_shape):
+    @staticmethod
+    def _plan_linear_cast(in_shape, cast_shape):
         """
-        Convert Linear outputs into Conv outputs.
+        Plan the conversion of Linear outputs into Conv outputs.
 
         Parameters
         ----------
-        tensor : torch.Tensor
-            The Linear tensor to reshape of shape [out_features]
+        in_shape : tuple
+            The Linear output shape [out_features].
         cast_shape : numpy.ndarray
-            The Conv shape to cast linear to of shape
-            [batch, num_channels, *spatial_dimensions].
+            The spatial dimensions to cast linear to.
 
         Returns
         -------
-        tensor : torch.Tensor
-            Tensor of shape [batch, num_channels, *spatial_dimensions]
+        step : tuple
+            (None, padding, [num_channels, *spatial_dimensions])
 
         """
         # Equivalent to calculating tensor.numel() in pytorch.
-        sequence_length = cast_shape.prod()
+        sequence_length = int(cast_shape.prod())
         # How many channels to spread the information into
-        # Ignore batch from linear
-        n_channels = ceil(tensor[-1].numel() / sequence_length)
+        n_channels = ceil(in_shape[-1] / sequence_length)
         # How much pad to add to either sides to reshape the linear tensor
         # into cast_shape spatial dimensions.
         pad_shape = sequence_length * n_channels
-        tensor = pad(tensor=tensor, padded_shape=[pad_shape])
-        return tensor.view(-1, n_channels, *cast_shape)
+        padding = get_padding(in_shape[-1:], [pad_shape])
+        return (None, padding if any(padding) else None,
+                (n_channels, *cast_shape.tolist()))
 
-    def _cast_conv_to_shape(self, tensor, cast_shape):
+    @staticmethod
+    def _plan_conv_cast(in_shape, cast_shape):
         """
-        Convert Conv outputs into Conv outputs.
+        Plan the conversion of Conv outputs into Conv outputs.
 
         Parameters
         ----------
-        tensor : torch.Tensor
-            The Conv tensor to reshape of shape
-            [batch, num_channels, *spatial_dimensions]
+        in_shape : tuple
+            The Conv output shape [num_channels, *spatial_dimensions].
         cast_shape : numpy.ndarray
-            The Conv shape to cast incoming Conv to shape
-            [batch, num_channels, *spatial_dimensions].
+            The spatial dimensions to cast incoming Conv to.
 
         Returns
         -------
-        tensor : torch.Tensor
-            Tensor of shape [batch, num_channels, *spatial_dimensions]
+        step : tuple
+            ([num_channels, *spatial_dimensions] or None, padding, None)
 
         """
-        # Extract only the spatial dimensions by ignoring the batch and channel
-        spatial_dim_idx_start = 2
-        if len(tensor.shape[spatial_dim_idx_start:]) < len(cast_shape):
-            # TODO: https://github.com/pytorch/pytorch/issues/9410
-            # Ignore batch for incoming tensor
+        spatial_shape = list(in_shape[1:])
+        reshape = None
+        if len(spatial_shape) < len(cast_shape):
             # For each missing dim, add dims until it
             # is equivalient to the max dim
-            n_unsqueezes = len(cast_shape) - \
-                len(tensor.shape[spatial_dim_idx_start:])
-            for _ in range(n_unsqueezes):
-                tensor = tensor.unsqueeze(dim=spatial_dim_idx_start)
-        return pad(tensor=tensor, padded_shape=cast_shape)
+            n_unsqueezes = len(cast_shape) - len(spatial_shape)
+            spatial_shape = [1] * n_unsqueezes + spatial_shape
+            reshape = (in_shape[0], *spatial_shape)
+        padding = get_padding(spatial_shape, cast_shape)
+        return (reshape, padding if any(padding) else None, None)
 
     def __str__(self):
         """Specify how to print network."""
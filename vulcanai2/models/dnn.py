@@ -99,8 +99,10 @@ class DenseNet(BaseNetwork):
         A dictionary of parameters for the desired optimizer.
     lr_scheduler : torch.optim.lr_scheduler
         A callable torch.optim.lr_scheduler
-    early_stopping : str or None
-        So far just 'best_validation_error' is implemented.
+    early_stopping : str, dict or None
+        Either 'best_validation_error' or 'best_validation_accuracy', or a
+        dict with that rule as 'name' and optional 'patience' and
+        'min_delta'. The best weights are restored at the end of fit.
     criter_spec : dict
         criterion specification with name and all its parameters.
 
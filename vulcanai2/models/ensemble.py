@@ -66,7 +66,8 @@ class SnapshotNet(BaseNetwork):
         self.n_snapshots = n_snapshots
 
     def fit(self, train_loader, val_loader, epochs,
-            retain_graph=None, valid_interv=4, plot=False):
+            retain_graph=None, valid_interv=4, plot=False,
+            mixed_precision=False, accumulate_steps=1, profile=False):
         """
         Train each model for T/M epochs and controls network learning rate.
 
@@ -80,6 +81,13 @@ class SnapshotNet(BaseNetwork):
             Input data and targets to validate against
         epochs : int
             Total number of epochs (evenly distributed between snapshots)
+        mixed_precision : boolean
+            Whether to train each snapshot under bfloat16 autocast.
+        accumulate_steps : int
+            The number of micro-batches each batch is split into.
+        profile : boolean
+            Whether to synchronize the device after every training phase
+            for exact phase times.
 
         Returns
         -------
@@ -113,7 +121,10 @@ class SnapshotNet(BaseNetwork):
                 val_loader=val_loader,
                 epochs=network_epochs,
                 valid_interv=valid_interv,
-                plot=plot
+                plot=plot,
+                mixed_precision=mixed_precision,
+                accumulate_steps=accumulate_steps,
+                profile=profile
             )
             # Save instance of snapshot in a nn.ModuleList
             temp_network = deepcopy(self.template_network)
@@ -169,6 +180,28 @@ class SnapshotNet(BaseNetwork):
 
         return torch.mean(input=pred_collector, dim=0)
 
+    def compile(self, apply_inputs=True, **compile_kwargs):
+        """
+        Compile every snapshot network.
+
+        Parameters
+        ----------
+        apply_inputs : boolean
+            Whether to compile all input networks recursively.
+        compile_kwargs : dict
+            Extra keyword arguments passed on to torch.compile.
+
+        Returns
+        -------
+        compiled : boolean
+            Whether all snapshots were compiled successfully.
+
+        """
+        if len(self.network) == 0:
+            raise ValueError("SnapshotNet needs to be trained.")
+        return all([net.compile(apply_inputs=apply_inputs, **compile_kwargs)
+                    for net in self.network])
+
     def save_model(self, save_path=None):
         """
         Save all ensembled network in a folder with ensemble name.
@@ -83,7 +83,8 @@ class FlattenUnit(BaseUnit):
 
     def forward(self, x):
         """Maintain batch size but flatten all remaining dimensions."""
-        return x.view(x.shape[0], -1)
+        # reshape, since quantized convs return channels last tensors
+        return x.reshape(x.shape[0], -1)
 
 
 class DenseUnit(BaseUnit):
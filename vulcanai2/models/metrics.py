@@ -1,23 +1,625 @@
 # coding=utf-8
 """Defines the network test suite."""
 import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
 from torch.utils import data
 
 import math
 import numpy as np
-from sklearn import metrics as skl_metrics
 
-from .utils import round_list
+from .utils import round_list, SharedDataset
 from ..plotters.visualization import display_confusion_matrix
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 import copy
+import os
+import pickle
+import shutil
+import tempfile
 
 import logging
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
 
 
+class MetricAccumulator(object):
+    """
+    Accumulate loss, correct counts and confusion counts during an epoch.
+
+    All running totals are tensors that live on the network's device, so
+    updating them never forces a host synchronization. The values are
+    only copied back to the host once when `compute` is called.
+
+    Parameters
+    ----------
+    num_classes : int or None
+        The number of classes predicted by the network. If None, only the
+        loss is accumulated.
+    device : str or torch.device
+        The device on which to keep the running totals.
+
+    Returns
+    -------
+    accumulator : MetricAccumulator
+
+    """
+
+    def __init__(self, num_classes=None, device=None):
+        """Initialize the running totals."""
+        self.num_classes = num_classes
+        self.device = device
+        # Binary networks with a single output still have two labels.
+        self._n_labels = max(num_classes, 2) if num_classes else None
+        self.reset()
+
+    def reset(self):
+        """Zero all running totals."""
+        self.n_samples = 0
+        self.loss_sum = torch.zeros(
+            [], dtype=torch.float64, device=self.device)
+        self.n_correct = torch.zeros(
+            [], dtype=torch.long, device=self.device)
+        self.confusion = None
+        if self._n_labels:
+            self.confusion = torch.zeros(
+                [self._n_labels, self._n_labels],
+                dtype=torch.long, device=self.device)
+
+    @staticmethod
+    def extract_class_labels(predictions):
+        """
+        Torch equivalent of Metrics.extract_class_labels.
+
+        Parameters
+        ----------
+        predictions : torch.Tensor
+            Network output of shape [batch, num_classes].
+
+        Returns
+        -------
+        class_labels : torch.LongTensor
+            1D class tensor on the same device as predictions.
+
+        """
+        if predictions.shape[1] > 1:
+            return predictions.argmax(dim=1)
+        return predictions.round().view(-1).long()
+
+    @torch.no_grad()
+    def update(self, loss, predictions, targets):
+        """
+        Add a batch to the running totals.
+
+        Parameters
+        ----------
+        loss : torch.Tensor
+            The batch loss, averaged over the batch.
+        predictions : torch.Tensor
+            Network output of shape [batch, num_classes].
+        targets : torch.Tensor
+            The target classes for the batch.
+
+        """
+        batch_size = targets.shape[0]
+        self.n_samples += batch_size
+        self.loss_sum += loss.detach().double() * batch_size
+        if self._n_labels:
+            targets = targets.view(-1).long()
+            class_labels = self.extract_class_labels(predictions)
+            self.n_correct += (class_labels == targets).sum()
+            # Rounded single outputs can fall outside the labels; leave
+            # those rows out of the confusion matrix without a host sync.
+            in_range = ((class_labels >= 0) &
+                        (class_labels < self._n_labels) &
+                        (targets >= 0) & (targets < self._n_labels))
+            index = (targets.clamp(0, self._n_labels - 1) * self._n_labels +
+                     class_labels.clamp(0, self._n_labels - 1))
+            self.confusion += torch.bincount(
+                index, weights=in_range.double(),
+                minlength=self._n_labels ** 2).long().view(
+                    self._n_labels, self._n_labels)
+
+    def all_reduce(self):
+        """Sum the running totals across all distributed processes."""
+        n_samples = torch.tensor(
+            [self.n_samples], dtype=torch.long, device=self.device)
+        totals = [self.loss_sum, n_samples, self.n_correct]
+        if self.confusion is not None:
+            totals.append(self.confusion)
+        for total in totals:
+            dist.all_reduce(total)
+        self.n_samples = int(n_samples.item())
+
+    def compute(self):
+        """
+        Read the epoch loss and accuracy back from the device.
+
+        Returns
+        -------
+        (loss, accuracy) : (float, float)
+            The sample-weighted mean loss and the accuracy. Accuracy is
+            nan when no num_classes was given.
+
+        """
+        if self.n_samples == 0:
+            return np.nan, np.nan
+        loss = self.loss_sum.item() / self.n_samples
+        accuracy = np.nan
+        if self._n_labels:
+            accuracy = self.n_correct.item() / self.n_samples
+        return loss, accuracy
+
+    @property
+    def confusion_matrix(self):
+        """
+        Return the accumulated confusion matrix.
+
+        Returns
+        -------
+        confusion_matrix : numpy.ndarray or None
+            Counts with targets along rows and predictions along columns.
+
+        """
+        if self.confusion is None:
+            return None
+        return self.confusion.cpu().numpy()
+
+
+class ConfusionMatrix(object):
+    """
+    Incremental confusion matrix every count-derived metric is read from.
+
+    Counts are accumulated with a single bincount per update, so they can
+    be built batch by batch and merged across shards. Like sklearn, the
+    per-class metrics only cover the labels seen in either the targets or
+    the predictions, in sorted order.
+
+    Counts may also be a stack of matrices, e.g. one per bootstrap
+    resample, in which case every metric is calculated per matrix.
+
+    Parameters
+    ----------
+    num_classes : int
+        The number of class labels.
+    counts : numpy.ndarray or None
+        Existing counts to start from, targets along rows and
+        predictions along columns, with any leading stack dimensions.
+    labels : numpy.ndarray of integers or None
+        The labels the per-class metrics cover. If None, the labels seen
+        in either the targets or the predictions.
+
+    Returns
+    -------
+    confusion_matrix : ConfusionMatrix
+
+    """
+
+    def __init__(self, num_classes=None, counts=None, labels=None):
+        """Initialize the counts."""
+        if counts is None:
+            if not num_classes:
+                raise ValueError("num_classes or counts must be given.")
+            counts = np.zeros([num_classes, num_classes], dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.num_classes = self.counts.shape[-1]
+        self._labels = labels
+        # The class label of each row and column
+        self.classes = np.arange(self.num_classes)
+
+    @classmethod
+    def from_predictions(cls, targets, predictions, num_classes=None):
+        """
+        Create a confusion matrix from class labels.
+
+        Parameters
+        ----------
+        targets : numpy.ndarray of integers
+            The target values.
+        predictions : numpy.ndarray of integers
+            The predicted values.
+        num_classes : int or None
+            The number of class labels 0 to num_classes - 1. If None,
+            any labels are accepted, like sklearn, and the rows and
+            columns are the sorted labels seen, kept in classes.
+
+        Returns
+        -------
+        confusion_matrix : ConfusionMatrix
+
+        """
+        if num_classes is not None:
+            confusion_matrix = cls(num_classes=num_classes)
+            confusion_matrix.update(targets, predictions)
+            return confusion_matrix
+        targets = np.asarray(targets).reshape(-1)
+        predictions = np.asarray(predictions).reshape(-1)
+        classes, inverse = np.unique(
+            np.concatenate([targets, predictions]), return_inverse=True)
+        confusion_matrix = cls(num_classes=max(len(classes), 1))
+        confusion_matrix.update(inverse[:len(targets)],
+                                inverse[len(targets):])
+        if len(classes):
+            confusion_matrix.classes = classes
+        return confusion_matrix
+
+    @staticmethod
+    def _as_labels(targets, predictions):
+        return (np.asarray(targets).reshape(-1).astype(np.int64),
+                np.asarray(predictions).reshape(-1).astype(np.int64))
+
+    def update(self, targets, predictions):
+        """
+        Add a batch of class labels to the counts.
+
+        Parameters
+        ----------
+        targets : numpy.ndarray of integers
+            The target values.
+        predictions : numpy.ndarray of integers
+            The predicted values.
+
+        Raises
+        ------
+        ValueError if a label is outside 0 to num_classes - 1.
+
+        """
+        targets, predictions = self._as_labels(targets, predictions)
+        for name, labels in [('targets', targets),
+                             ('predictions', predictions)]:
+            if len(labels) and (labels.min() < 0 or
+                                labels.max() >= self.num_classes):
+                raise ValueError(
+                    "{} must be class labels from 0 to {}, got labels "
+                    "from {} to {}.".format(name, self.num_classes - 1,
+                                            labels.min(), labels.max()))
+        self.counts += np.bincount(
+            targets * self.num_classes + predictions,
+            minlength=self.num_classes ** 2).reshape(
+                self.num_classes, self.num_classes)
+
+    def merge(self, other):
+        """
+        Add the counts of another confusion matrix, e.g. from a shard.
+
+        Parameters
+        ----------
+        other : ConfusionMatrix
+            The confusion matrix to add.
+
+        Returns
+        -------
+        self : ConfusionMatrix
+
+        """
+        if other.counts.shape != self.counts.shape:
+            raise ValueError("Can't merge confusion matrices of shape {} "
+                             "and {}.".format(self.counts.shape,
+                                              other.counts.shape))
+        self.counts += other.counts
+        return self
+
+    @property
+    def labels(self):
+        """The labels seen in either the targets or the predictions."""
+        if self._labels is not None:
+            return np.asarray(self._labels)
+        seen = self.counts.sum(axis=-2) + self.counts.sum(axis=-1)
+        return np.flatnonzero(seen.reshape(-1, self.num_classes).sum(axis=0))
+
+    @property
+    def matrix(self):
+        """The counts restricted to the seen labels, like sklearn."""
+        labels = self.labels
+        return self.counts[..., labels, :][..., labels]
+
+    @property
+    def n_samples(self):
+        """The number of samples counted."""
+        return int(self.counts.sum())
+
+    def get_values(self):
+        """
+        Calculate the tp, tn, fp, fn values of each seen label.
+
+        Returns
+        -------
+        tp, tn, fp, fn:  array of np.float32 with classes in sorted order
+            The true positive/negative, false positive/negative values.
+
+        """
+        matrix = self.matrix
+        tp = np.diagonal(matrix, axis1=-2, axis2=-1).astype('float32')
+        # sum each column and remove diagonal
+        fp = (matrix.sum(axis=-2) - tp).astype('float32')
+        # sum each row and remove diagonal
+        fn = (matrix.sum(axis=-1) - tp).astype('float32')
+        tn = (matrix.sum(axis=(-2, -1))[..., None] -
+              tp - fp - fn).astype('float32')
+        return tp, tn, fp, fn
+
+    def _average(self, numerator, denominator, average, zero_division):
+        """Divide the per-class counts and apply average."""
+        if average == 'micro':
+            numerator = numerator.sum(axis=-1)
+            denominator = denominator.sum(axis=-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = numerator / denominator
+        if zero_division is not None:
+            values = np.where(denominator == 0, zero_division, values)
+        if average is None or average == 'micro':
+            return values
+        if average == 'macro':
+            return np.average(values, axis=-1)
+        if average == 'weighted':
+            support = self.matrix.sum(axis=-1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return ((values * support).sum(axis=-1) /
+                        support.sum(axis=-1))
+        if average == 'binary':
+            # Score of the positive label, 1
+            positive = np.flatnonzero(self.classes[self.labels] == 1)
+            if not len(positive):
+                return np.zeros(values.shape[:-1])[()]
+            return values[..., positive[0]]
+        raise NotImplementedError
+
+    def accuracy(self):
+        """Return the fraction of correctly predicted samples."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (np.trace(self.counts, axis1=-2, axis2=-1) /
+                    self.counts.sum(axis=(-2, -1)))
+
+    def sensitivity(self, average=None):
+        """Return tp / (tp + fn), 0 where undefined like sklearn."""
+        tp, _, _, fn = self.get_values()
+        return self._average(tp, tp + fn, average, zero_division=0.)
+
+    def specificity(self, average=None):
+        """Return tn / (tn + fp)."""
+        _, tn, fp, _ = self.get_values()
+        return self._average(tn, tn + fp, average, zero_division=None)
+
+    def ppv(self, average=None):
+        """Return tp / (tp + fp), 0 where undefined like sklearn."""
+        tp, _, fp, _ = self.get_values()
+        return self._average(tp, tp + fp, average, zero_division=0.)
+
+    def npv(self, average=None):
+        """Return tn / (tn + fn), 0 where undefined."""
+        _, tn, _, fn = self.get_values()
+        return self._average(tn, tn + fn, average, zero_division=0.)
+
+    def dice(self, average=None):
+        """Return 2tp / (2tp + fp + fn)."""
+        tp, _, fp, fn = self.get_values()
+        return self._average(
+            2 * tp, 2 * tp + fp + fn, average, zero_division=None)
+
+    def f1(self, average=None):
+        """Return 2tp / (2tp + fp + fn), 0 where undefined like sklearn."""
+        tp, _, fp, fn = self.get_values()
+        return self._average(
+            2 * tp, 2 * tp + fp + fn, average, zero_division=0.)
+
+
+def _one_vs_rest(targets, raw_predictions, num_classes):
+    """
+    Split raw predictions into one-vs-rest scores and positives.
+
+    Parameters
+    ----------
+    targets : numpy.ndarray of integers
+        The target values.
+    raw_predictions : numpy.ndarray of floats
+        The raw predicted values, not converted to classes.
+    num_classes : int
+        The number of network outputs. 1 for binary networks with a
+        single output.
+
+    Returns
+    -------
+    scores, positives : numpy.ndarray, numpy.ndarray of bool
+        Both of shape [n_samples, max(num_classes, 1)].
+
+    """
+    targets = np.asarray(targets).reshape(-1)
+    raw_predictions = np.asarray(raw_predictions)
+    if num_classes == 1:
+        return (raw_predictions.reshape(-1, 1),
+                (targets == 1).reshape(-1, 1))
+    return (raw_predictions[:, :num_classes],
+            targets[:, None] == np.arange(num_classes))
+
+
+def _average_auc(auc, n_positives, average):
+    """Apply average to per-class AUCs, along the last axis."""
+    if average is None:
+        return auc
+    if average == 'macro':
+        return np.average(auc, axis=-1)
+    if average == 'weighted':
+        return ((auc * n_positives).sum(axis=-1) /
+                n_positives.sum(axis=-1))
+    raise NotImplementedError
+
+
+def _tie_bounds(sorted_scores):
+    """
+    Find the first and last position of each score's tie group.
+
+    Parameters
+    ----------
+    sorted_scores : numpy.ndarray
+        Scores sorted along the first axis.
+
+    Returns
+    -------
+    first, last : numpy.ndarray of integers
+        Same shape as sorted_scores.
+
+    """
+    n_samples = len(sorted_scores)
+    index = np.arange(n_samples).reshape(-1, *[1] * (sorted_scores.ndim - 1))
+    starts = np.ones(sorted_scores.shape, dtype=bool)
+    starts[1:] = sorted_scores[1:] != sorted_scores[:-1]
+    ends = np.ones(sorted_scores.shape, dtype=bool)
+    ends[:-1] = starts[1:]
+    first = np.maximum.accumulate(np.where(starts, index, 0), axis=0)
+    last = np.minimum.accumulate(
+        np.where(ends, index, n_samples - 1)[::-1], axis=0)[::-1]
+    return first, last
+
+
+def _weighted_auc(weights, positives, first, last):
+    """
+    Calculate one class's AUC for many sample weightings at once.
+
+    Parameters
+    ----------
+    weights : numpy.ndarray
+        The weight of each sample, of shape [n_weightings, n_samples],
+        in ascending score order.
+    positives : numpy.ndarray of bool
+        Whether each sample is positive, in ascending score order.
+    first, last : numpy.ndarray of integers
+        The tie group bounds of each sample, from _tie_bounds.
+
+    Returns
+    -------
+    auc, n_positives : numpy.ndarray, numpy.ndarray
+        The AUC and positive weight of each weighting.
+
+    """
+    positive_weights = weights * positives
+    negative_weights = weights - positive_weights
+    cumulative = np.zeros([len(weights), weights.shape[1] + 1])
+    np.cumsum(negative_weights, axis=1, out=cumulative[:, 1:])
+    # Negatives scored below each sample, plus half of those tied with it
+    below = cumulative[:, first]
+    tied = cumulative[:, last + 1] - below
+    wins = (positive_weights * (below + 0.5 * tied)).sum(axis=1)
+    n_positives = positive_weights.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        auc = wins / (n_positives * negative_weights.sum(axis=1))
+    return auc, n_positives
+
+
+class StreamingAUC(object):
+    """
+    One-vs-rest AUC from fixed-bin score histograms.
+
+    Each update bins the scores of a batch into per-class histograms of
+    positive and negative samples, so memory is O(classes x bins) however
+    many samples are seen. Scores sharing a bin count as ties, which
+    bounds the error against the exact AUC by the fraction of
+    positive/negative pairs sharing a bin. Histograms can be merged
+    across shards.
+
+    Parameters
+    ----------
+    num_classes : int
+        The number of network outputs. 1 for binary networks with a
+        single output.
+    n_bins : int
+        The number of histogram bins per class.
+    score_range : (float, float)
+        The range of the scores. Scores outside it go into the end bins.
+
+    Returns
+    -------
+    auc : StreamingAUC
+
+    """
+
+    def __init__(self, num_classes, n_bins=1000, score_range=(0., 1.)):
+        """Initialize the histograms."""
+        if n_bins < 1:
+            raise ValueError("n_bins must be >= 1.")
+        self.num_classes = num_classes
+        self.n_bins = n_bins
+        self.score_range = score_range
+        n_columns = max(num_classes, 1)
+        self.positives = np.zeros([n_columns, n_bins], dtype=np.int64)
+        self.negatives = np.zeros([n_columns, n_bins], dtype=np.int64)
+
+    def update(self, targets, raw_predictions):
+        """
+        Add a batch to the histograms.
+
+        Parameters
+        ----------
+        targets : numpy.ndarray of integers
+            The target values.
+        raw_predictions : numpy.ndarray of floats
+            The raw predicted values, not converted to classes.
+
+        """
+        scores, positives = _one_vs_rest(
+            targets, raw_predictions, self.num_classes)
+        low, high = self.score_range
+        bins = np.clip(((scores - low) / (high - low) *
+                        self.n_bins).astype(np.int64), 0, self.n_bins - 1)
+        # One bincount over all classes at once
+        bins += np.arange(scores.shape[1]) * self.n_bins
+        size = self.positives.size
+        n_positives = np.bincount(
+            bins[positives], minlength=size).reshape(self.positives.shape)
+        totals = np.bincount(
+            bins.reshape(-1), minlength=size).reshape(self.positives.shape)
+        self.positives += n_positives
+        self.negatives += totals - n_positives
+
+    def merge(self, other):
+        """
+        Add the histograms of another StreamingAUC, e.g. from a shard.
+
+        Parameters
+        ----------
+        other : StreamingAUC
+            The histograms to add.
+
+        Returns
+        -------
+        self : StreamingAUC
+
+        """
+        if other.positives.shape != self.positives.shape or \
+                other.score_range != self.score_range:
+            raise ValueError("Can't merge StreamingAUC with different "
+                             "classes, bins or score range.")
+        self.positives += other.positives
+        self.negatives += other.negatives
+        return self
+
+    def compute(self, average=None):
+        """
+        Calculate the AUC from the histograms.
+
+        Parameters
+        ----------
+        average: string
+            [None, 'macro', 'weighted']
+            If None, the scores for each class are returned.
+
+        Returns
+        -------
+        auc: np.float64 or array of np.float64
+            The AUC, nan for classes without both positives and negatives.
+
+        """
+        n_positives = self.positives.sum(axis=1)
+        n_negatives = self.negatives.sum(axis=1)
+        # Negatives scored below each bin, plus half of those tied in it
+        negatives_below = np.cumsum(self.negatives, axis=1) - self.negatives
+        wins = (self.positives *
+                (negatives_below + 0.5 * self.negatives)).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            auc = wins / (n_positives * n_negatives)
+        return _average_auc(auc, n_positives, average)
+
+
 # noinspection PyProtectedMember
 class Metrics(object):
     """
@@ -130,20 +732,8 @@ class Metrics(object):
             The true positive/negative, false positive/negative values.
 
         """
-        # credit: Robert Fratila
-        confusion_matrix = skl_metrics.confusion_matrix(targets, predictions)
-        tp = np.diagonal(confusion_matrix).astype('float32')
-        tn = (np.array(
-            [np.sum(confusion_matrix)] *
-            confusion_matrix.shape[0]) -
-            confusion_matrix.sum(axis=0) -
-            confusion_matrix.sum(axis=1) + tp).astype('float32')
-        # sum each column and remove diagonal
-        fp = (confusion_matrix.sum(axis=0) - tp).astype('float32')
-        # sum each row and remove diagonal
-        fn = (confusion_matrix.sum(axis=1) - tp).astype('float32')
-
-        return tp, tn, fp, fn
+        return ConfusionMatrix.from_predictions(
+            targets, predictions).get_values()
 
     @staticmethod
     def _check_average_parameter(targets, predictions, average):
@@ -216,9 +806,8 @@ class Metrics(object):
 
         """
         assert Metrics._check_average_parameter(targets, predictions, average)
-        sensitivity = skl_metrics.recall_score(targets, predictions,
-                                               average=average)
-        return sensitivity
+        return ConfusionMatrix.from_predictions(
+            targets, predictions).sensitivity(average)
 
     @staticmethod
     def get_specificity(targets, predictions, average=None):
@@ -244,17 +833,8 @@ class Metrics(object):
             The specificity.
 
         """
-        _, tn, fp, _ = Metrics.get_confusion_matrix_values(targets,
-                                                           predictions)
-        specificity = tn / (tn + fp)
-
-        # TODO: implement other options
-        if average == "macro":
-            specificity = np.average(specificity)
-        elif average:
-            raise NotImplementedError
-
-        return specificity
+        return ConfusionMatrix.from_predictions(
+            targets, predictions).specificity(average)
 
     @staticmethod
     def get_dice(targets, predictions, average=None):
@@ -269,7 +849,6 @@ class Metrics(object):
             The predicted values.
         average: string
             [None, ‘binary’ (default), ‘micro’, ‘macro’, ‘samples’, ‘weighted’]
-            Only None and 'macro' currently implemented.
             This parameter is required for multiclass/multilabel targets.
             If None, the scores for each class are returned.
             Otherwise, this determines the type of averaging performed on the
@@ -281,17 +860,8 @@ class Metrics(object):
             The dice metric.
 
         """
-        tp, _, fp, fn = Metrics.get_confusion_matrix_values(targets,
-                                                            predictions)
-        dice = 2 * tp / (2 * tp + fp + fn)
-
-        # TODO: implement other options
-        if average == "macro":
-            dice = np.average(dice)
-        elif average:
-            raise NotImplementedError
-
-        return dice
+        return ConfusionMatrix.from_predictions(
+            targets, predictions).dice(average)
 
     @staticmethod
     def get_ppv(targets, predictions, average=None):
@@ -306,7 +876,6 @@ class Metrics(object):
             The predicted values.
         average: string
             [None, ‘binary’ (default), ‘micro’, ‘macro’, ‘samples’, ‘weighted’]
-            Only None and 'macro' currently implemented.
             This parameter is required for multiclass/multilabel targets.
             If None, the scores for each class are returned.
             Otherwise, this determines the type of averaging performed on the
@@ -320,10 +889,8 @@ class Metrics(object):
         """
         assert Metrics._check_average_parameter(targets, predictions,
                                                 average=average)
-        ppv = skl_metrics.precision_score(targets, predictions,
-                                          average=average)
-
-        return ppv
+        return ConfusionMatrix.from_predictions(
+            targets, predictions).ppv(average)
 
     @staticmethod
     def get_npv(targets, predictions, average=None):
@@ -338,7 +905,6 @@ class Metrics(object):
             The predicted values.
         average: string
             [None, ‘binary’ (default), ‘micro’, ‘macro’, ‘samples’, ‘weighted’]
-            Only None and 'macro' currently implemented.
             This parameter is required for multiclass/multilabel targets.
             If None, the scores for each class are returned.
             Otherwise, this determines the type of averaging performed on the
@@ -350,18 +916,8 @@ class Metrics(object):
             The negative predictive value
 
         """
-        _, tn, _, fn = Metrics.get_confusion_matrix_values(targets,
-                                                           predictions)
-
-        npv = np.nan_to_num(tn / (tn + fn))
-
-        # TODO: implement other options
-        if average == "macro":
-            npv = np.average(npv)
-        elif average:
-            raise NotImplementedError
-
-        return npv
+        return ConfusionMatrix.from_predictions(
+            targets, predictions).npv(average)
 
     @staticmethod
     def get_accuracy(targets, predictions):
@@ -381,9 +937,8 @@ class Metrics(object):
             The accuracy.
 
         """
-        accuracy = skl_metrics.accuracy_score(targets, predictions)
-
-        return accuracy
+        return ConfusionMatrix.from_predictions(
+            targets, predictions).accuracy()
 
     @staticmethod
     def get_f1(targets, predictions, average=None):
@@ -410,61 +965,191 @@ class Metrics(object):
 
         """
         assert Metrics._check_average_parameter(targets, predictions, average)
-        f1 = skl_metrics.f1_score(targets, predictions, average=average)
-
-        return f1
+        return ConfusionMatrix.from_predictions(
+            targets, predictions).f1(average)
 
     @staticmethod
     def get_auc(targets, raw_predictions, num_classes, average=None):
         """
         Calculate the AUC. Note: raw_predictions and num_classes are required.
 
+        All classes are ranked with one argsort over the score columns,
+        and each one-vs-rest AUC is the Mann-Whitney U statistic of its
+        tie-averaged ranks, which equals the area under the ROC curve.
+
         Parameters
         ----------
         targets: numpy.ndarray of integers
             The target values.
         raw_predictions: numpy.ndarray of floats
             The raw predicted values, not converted to classes.
+        num_classes : int
+            The number of network outputs.
         average: string
-            [None, ‘binary’ (default), ‘micro’, ‘macro’, ‘samples’, ‘weighted’]
-            This parameter is required for multiclass/multilabel targets.
+            [None, 'macro', 'weighted']
             If None, the scores for each class are returned.
-            Otherwise, this determines the type of averaging performed on the
-            data. See Scikit learn.
+            'weighted' weighs each class by its number of targets.
 
         Returns
         -------
-        f1: np.float32 or array of np.float32
-            The AUC.
+        auc: np.float64 or array of np.float64
+            The AUC, nan for classes without both positives and negatives.
 
         """
         if raw_predictions.ndim == 1:
             raise ValueError("You must provide raw predictions not \
                              class_converted predictions")
 
-        all_class_auc = []
-        for i in range(num_classes):
-            if num_classes == 1:
-                fpr, tpr, _ = skl_metrics.roc_curve(targets,
-                                                    raw_predictions,
-                                                    pos_label=1)
-            else:
-                fpr, tpr, _ = skl_metrics.roc_curve(targets,
-                                                    raw_predictions[:, i],
-                                                    pos_label=i)
+        scores, positives = _one_vs_rest(targets, raw_predictions,
+                                         num_classes)
+        n_samples = len(scores)
+        order = np.argsort(scores, axis=0, kind='mergesort')
+        # Tied scores share the average of their ranks
+        first, last = _tie_bounds(np.take_along_axis(scores, order, axis=0))
+        ranks = (first + last) / 2. + 1
+
+        sorted_positives = np.take_along_axis(positives, order, axis=0)
+        n_positives = positives.sum(axis=0)
+        n_negatives = n_samples - n_positives
+        rank_sums = (ranks * sorted_positives).sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            auc = ((rank_sums - n_positives * (n_positives + 1) / 2.) /
+                   (n_positives * n_negatives))
+        return _average_auc(auc, n_positives, average)
 
-            auc = skl_metrics.auc(fpr, tpr)
-            all_class_auc += [auc]
+    @staticmethod
+    def bootstrap(targets, raw_predictions, metrics=None, n_resamples=10000,
+                  alpha=0.05, average='macro', batch_size=None,
+                  random_state=None):
+        """
+        Calculate percentile bootstrap confidence intervals.
 
-        # TODO: implement other options
-        if average == "macro":
-            all_class_auc = np.average(all_class_auc)
-        elif average:
-            raise NotImplementedError
+        Resamples are drawn as index matrices, batch_size at a time, and
+        the confusion counts and AUCs of a whole batch are calculated at
+        once, without a Python loop per resample.
 
-        return all_class_auc
+        Parameters
+        ----------
+        targets: numpy.ndarray of integers
+            The target values.
+        raw_predictions: numpy.ndarray of floats
+            The raw predicted values, not converted to classes.
+        metrics: list of strings or None
+            Any of 'accuracy', 'sensitivity', 'specificity', 'ppv', 'npv',
+            'f1', 'dice' and 'auc'. If None, all of them.
+        n_resamples : int
+            The number of bootstrap resamples.
+        alpha : float
+            The intervals cover the central 1 - alpha of the resampled
+            values.
+        average: string
+            [None, 'macro', 'weighted']
+            If None, intervals for each class are returned.
+        batch_size : int or None
+            The number of resamples drawn at once. If None, as many as
+            fit in about 4M samples.
+        random_state : int, numpy.random.RandomState or None
+            Seed or random state to draw the resamples with.
+
+        Returns
+        -------
+        results: dict
+            For each metric, a dict with the estimate on all samples and
+            the lower and upper bounds of the interval.
+
+        """
+        all_metrics = ['accuracy', 'sensitivity', 'specificity', 'ppv',
+                       'npv', 'f1', 'dice', 'auc']
+        if metrics is None:
+            metrics = all_metrics
+        elif isinstance(metrics, str):
+            metrics = [metrics]
+        unknown = set(metrics) - set(all_metrics)
+        if unknown:
+            raise ValueError("Can't bootstrap metrics {}, choose from "
+                             "{}.".format(sorted(unknown), all_metrics))
+        if n_resamples < 1:
+            raise ValueError("n_resamples must be >= 1.")
+        if not 0 < alpha < 1:
+            raise ValueError("alpha must be between 0 and 1.")
+        raw_predictions = np.asarray(raw_predictions)
+        if raw_predictions.ndim == 1:
+            raise ValueError("You must provide raw predictions not \
+                             class_converted predictions")
 
-    def run_test(self, network, data_loader, figure_path=None, plot=False):
+        num_classes = raw_predictions.shape[1]
+        n_labels = max(num_classes, 2)
+        targets = np.asarray(targets).reshape(-1).astype(np.int64)
+        predictions = Metrics.extract_class_labels(
+            raw_predictions).reshape(-1).astype(np.int64)
+        n_samples = len(targets)
+        # The confusion matrix cell of each sample
+        cells = targets * n_labels + predictions
+        # Resamples missing a class still report it, like the estimate
+        labels = ConfusionMatrix.from_predictions(
+            targets, predictions, num_classes=n_labels).labels
+        if 'auc' in metrics:
+            scores, positives = _one_vs_rest(
+                targets, raw_predictions, num_classes)
+            orders = np.argsort(scores, axis=0, kind='mergesort')
+            first, last = _tie_bounds(
+                np.take_along_axis(scores, orders, axis=0))
+            sorted_positives = np.take_along_axis(positives, orders, axis=0)
+
+        def score(indices):
+            """Calculate the metrics for each row of sample indices."""
+            n_rows = len(indices)
+            offsets = np.arange(n_rows)[:, None]
+            counts = np.bincount(
+                (offsets * n_labels ** 2 + cells[indices]).reshape(-1),
+                minlength=n_rows * n_labels ** 2).reshape(
+                    n_rows, n_labels, n_labels)
+            cm = ConfusionMatrix(counts=counts, labels=labels)
+            results = {}
+            for metric in metrics:
+                if metric == 'accuracy':
+                    results[metric] = cm.accuracy()
+                elif metric == 'auc':
+                    # How often each sample was drawn
+                    weights = np.bincount(
+                        (offsets * n_samples + indices).reshape(-1),
+                        minlength=n_rows * n_samples).reshape(
+                            n_rows, n_samples)
+                    auc, n_positives = zip(*[
+                        _weighted_auc(weights[:, orders[:, i]],
+                                      sorted_positives[:, i],
+                                      first[:, i], last[:, i])
+                        for i in range(scores.shape[1])])
+                    results[metric] = _average_auc(
+                        np.stack(auc, axis=-1),
+                        np.stack(n_positives, axis=-1), average)
+                else:
+                    results[metric] = getattr(cm, metric)(average)
+            return results
+
+        if not isinstance(random_state, np.random.RandomState):
+            random_state = np.random.RandomState(random_state)
+        if batch_size is None:
+            batch_size = max(1, 2 ** 22 // max(n_samples, 1))
+        resampled = defaultdict(list)
+        for start in range(0, n_resamples, batch_size):
+            indices = random_state.randint(
+                0, n_samples,
+                size=[min(batch_size, n_resamples - start), n_samples])
+            for metric, values in score(indices).items():
+                resampled[metric].append(values)
+
+        percentiles = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+        results = {}
+        for metric, estimate in score(np.arange(n_samples)[None]).items():
+            lower, upper = np.nanpercentile(
+                np.concatenate(resampled[metric]), percentiles, axis=0)
+            results[metric] = dict(
+                estimate=estimate[0], lower=lower, upper=upper)
+        return results
+
+    def run_test(self, network, data_loader, figure_path=None, plot=False,
+                 auc_bins=None):
         """
         Will conduct the test suite to determine network strength.
 
@@ -476,6 +1161,11 @@ class Metrics(object):
             Folder to place images in.
         plot: bool
             Determine if graphs should be plotted in real time.
+        auc_bins : int or None
+            If None, the exact AUC is calculated from all predictions.
+            Otherwise the outputs are streamed batch by batch and the AUC
+            is approximated with auc_bins score histogram bins per class,
+            so memory doesn't grow with the dataset.
 
         Returns
         -------
@@ -490,48 +1180,51 @@ class Metrics(object):
             raise ValueError('There\'s no classification layer')
 
         num_classes = network._num_classes
-        # getting just the y values out of the dataset
-        # TODO: store in tensor for continuity?
-        targets = np.array([v[1] for v in data_loader.dataset])
-
-        raw_predictions = network.forward_pass(
-            data_loader=data_loader,
-            convert_to_class=False)
-
-        predictions = self.extract_class_labels(raw_predictions)
-
-        cm = skl_metrics.confusion_matrix(targets, predictions)
+        # Every count-derived metric reads from this one matrix.
+        cm = ConfusionMatrix(num_classes=max(num_classes, 2))
+        # Targets come from the same batches, not a second dataset pass
+        if auc_bins:
+            streaming_auc = StreamingAUC(num_classes, n_bins=auc_bins)
+            for raw_predictions, targets in network.iter_forward_pass(
+                    data_loader=data_loader, return_targets=True):
+                cm.update(targets,
+                          self.extract_class_labels(raw_predictions))
+                streaming_auc.update(targets, raw_predictions)
+            auc = streaming_auc.compute()
+            auc_macro = streaming_auc.compute(average="macro")
+        else:
+            raw_predictions, targets = network.forward_pass(
+                data_loader=data_loader,
+                convert_to_class=False,
+                return_targets=True)
+            cm.update(targets, self.extract_class_labels(raw_predictions))
+            auc = Metrics.get_auc(targets, raw_predictions, num_classes)
+            auc_macro = Metrics.get_auc(targets, raw_predictions,
+                                        num_classes, average="macro")
         if plot:
-            display_confusion_matrix(cm)
-
-        tp, tn, fp, fn = Metrics.get_confusion_matrix_values(targets,
-                                                             predictions)
+            display_confusion_matrix(cm.matrix)
 
-        sensitivity = Metrics.get_specificity(targets, predictions)
-        sensitivity_macro = Metrics.get_specificity(targets, predictions,
-                                                    average="macro")
+        tp, tn, fp, fn = cm.get_values()
 
-        specificity = Metrics.get_specificity(targets, predictions)
-        specificity_macro = Metrics.get_specificity(targets, predictions,
-                                                    average="macro")
+        sensitivity = cm.sensitivity()
+        sensitivity_macro = cm.sensitivity(average="macro")
 
-        dice = Metrics.get_dice(targets, predictions)
-        dice_macro = Metrics.get_dice(targets, predictions, average="macro")
+        specificity = cm.specificity()
+        specificity_macro = cm.specificity(average="macro")
 
-        ppv = Metrics.get_ppv(targets, predictions)
-        ppv_macro = Metrics.get_ppv(targets, predictions, average="macro")
+        dice = cm.dice()
+        dice_macro = cm.dice(average="macro")
 
-        npv = Metrics.get_npv(targets, predictions)
-        npv_macro = Metrics.get_npv(targets, predictions, average="macro")
+        ppv = cm.ppv()
+        ppv_macro = cm.ppv(average="macro")
 
-        accuracy = Metrics.get_accuracy(targets, predictions)
+        npv = cm.npv()
+        npv_macro = cm.npv(average="macro")
 
-        f1 = Metrics.get_f1(targets, predictions)
-        f1_macro = Metrics.get_f1(targets, predictions, average="macro")
+        accuracy = cm.accuracy()
 
-        auc = Metrics.get_auc(targets, raw_predictions, num_classes)
-        auc_macro = Metrics.get_auc(targets, raw_predictions, num_classes,
-                                    average="macro")
+        f1 = cm.f1()
+        f1_macro = cm.f1(average="macro")
 
         logger.info('{} test\'s results'.format(network.name))
 
@@ -583,7 +1276,8 @@ class Metrics(object):
     # TODO: include support
     def cross_validate(self, network, data_loader, k, epochs,
                        average_results=True, retain_graph=None,
-                       valid_interv=4, plot=False, figure_path=None):
+                       valid_interv=4, plot=False, figure_path=None,
+                       n_jobs=1, cache_dir=None):
         """
         Perform k-fold cross validation given a Network and DataLoader object.
 
@@ -606,16 +1300,36 @@ class Metrics(object):
             Specifies after how many epochs validation should occur.
         plot : boolean
             Whether or not to plot all results in prompt and charts.
+            Ignored by folds run in worker processes.
         figure_path : str
             Where to save all figures and results.
+        n_jobs : int
+            The number of folds trained at once, each in its own local
+            process, cpu networks only. The dataset is copied once into
+            shared memory for all of them, so each sample is read only
+            once: random dataset transforms are frozen for all epochs and
+            folds, unlike with n_jobs=1. Scripts using this must guard
+            their entry point with `if __name__ == '__main__':`.
+        cache_dir : str or None
+            With n_jobs > 1, share the dataset through memory-mapped files
+            in this directory instead of shared memory.
 
         Returns
         -------
         results : dict
             If average_results is on, return dict of floats.
-            If average_results is off, return dict of float lists.
+            If average_results is off, return dict of float lists,
+            with the index of each fold under 'fold'.
+            Results are always in fold order. If interrupted, only the
+            completed folds are included.
 
         """
+        if n_jobs < 1:
+            raise ValueError("n_jobs must be >= 1.")
+        if n_jobs > 1 and network.device.type != 'cpu':
+            raise ValueError(
+                "Parallel cross validation only supports cpu networks, "
+                "got {}.".format(network.device))
         all_results = defaultdict(lambda: [])
 
         # TODO: this whole section is really clunky
@@ -633,53 +1347,44 @@ class Metrics(object):
 
         dataset_splits = data.random_split(data_loader.dataset,
                                            fold_seq)
-
-        batch_size = data_loader.batch_size
+        fold_indices = [list(split.indices) for split in dataset_splits]
 
         # #TODO: improve the copying of parameters
         # Set to true if RandomSampler exists.
-        shuffle = isinstance(data_loader.sampler, data.sampler.RandomSampler)
-
-        try:
-            for fold in range(k):
-
-                # TODO: this may break on different devices?? test.
-                # TODO: Re-initialize instead of deepcopy?
-                cross_val_network = copy.deepcopy(network)
-
-                # TODO: properly pass params
-
-                # Generate fold training set.
-                train_dataset = data.ConcatDataset(
-                    dataset_splits[:fold] + dataset_splits[fold+1:])
-                # Generate fold validation set.
-                val_dataset = dataset_splits[fold]
-                # Generate fold training data loader object.
-                train_loader = data.DataLoader(
-                    train_dataset, batch_size=batch_size, shuffle=shuffle)
-                # Generate fold validation data loader object.
-                val_loader = data.DataLoader(
-                    val_dataset, batch_size=batch_size)
-                # Train network on fold training data loader.
-                cross_val_network.fit(
-                    train_loader, val_loader, epochs,
-                    retain_graph=retain_graph,
-                    valid_interv=valid_interv, plot=plot)
-                # Validate network performance on validation data loader.
-                results = self.run_test(
-                    cross_val_network, val_loader,
-                    figure_path=figure_path, plot=plot)
-
-                logger.info(results)
-                for m in results:
-                    all_results[m].append(results[m])
-
-        # TODO: we could show something better here like calculate
-        # all the results so far
-        except KeyboardInterrupt:
-            logger.info(
-                "\n\n***KeyboardInterrupt: Cross validate stopped \
-                prematurely.***\n\n")
+        fold_kwargs = dict(
+            batch_size=data_loader.batch_size,
+            shuffle=isinstance(data_loader.sampler,
+                               data.sampler.RandomSampler),
+            epochs=epochs,
+            fit_kwargs=dict(retain_graph=retain_graph,
+                            valid_interv=valid_interv, plot=plot),
+            figure_path=figure_path)
+
+        if n_jobs > 1:
+            fold_results = self._cross_validate_parallel(
+                network, data_loader.dataset, fold_indices,
+                min(n_jobs, k), cache_dir, fold_kwargs)
+        else:
+            fold_results = []
+            try:
+                for fold in range(k):
+                    # TODO: Re-initialize instead of deepcopy?
+                    fold_results.append((fold, self._cross_validate_fold(
+                        copy.deepcopy(network), data_loader.dataset,
+                        fold_indices, fold, **fold_kwargs)))
+            # TODO: we could show something better here like calculate
+            # all the results so far
+            except KeyboardInterrupt:
+                logger.info(
+                    "\n\n***KeyboardInterrupt: Cross validate stopped \
+                    prematurely.***\n\n")
+
+        for fold, results in fold_results:
+            for m in results:
+                all_results[m].append(results[m])
+            # Partial runs may skip folds, so keep which fold is which
+            if not average_results:
+                all_results['fold'].append(fold)
 
         if average_results:
             averaged_all_results = {}
@@ -688,3 +1393,122 @@ class Metrics(object):
             return averaged_all_results
         else:
             return all_results
+
+    def _cross_validate_fold(self, network, dataset, fold_indices, fold,
+                             batch_size, shuffle, epochs, fit_kwargs,
+                             figure_path):
+        """Train network on all folds but fold, then test it on fold."""
+        train_indices = [idx for i, indices in enumerate(fold_indices)
+                         if i != fold for idx in indices]
+        # Generate fold training data loader object.
+        train_loader = data.DataLoader(
+            data.Subset(dataset, train_indices),
+            batch_size=batch_size, shuffle=shuffle)
+        # Generate fold validation data loader object.
+        val_loader = data.DataLoader(
+            data.Subset(dataset, fold_indices[fold]), batch_size=batch_size)
+        # Train network on fold training data loader.
+        network.fit(train_loader, val_loader, epochs, **fit_kwargs)
+        # Validate network performance on validation data loader.
+        results = self.run_test(
+            network, val_loader,
+            figure_path=figure_path, plot=fit_kwargs['plot'])
+        logger.info(results)
+        return results
+
+    def _cross_validate_parallel(self, network, dataset, fold_indices,
+                                 n_jobs, cache_dir, fold_kwargs):
+        """
+        Run the folds of cross_validate in a pool of n_jobs processes.
+
+        Parameters
+        ----------
+        network : BaseNetwork
+            Network descendant of BaseNetwork.
+        dataset : torch.utils.data.Dataset
+            The dataset to cross validate on.
+        fold_indices : list of list of int
+            The dataset indices of each fold.
+        n_jobs : int
+            The number of worker processes.
+        cache_dir : str or None
+            Share the dataset through memory-mapped files in a directory
+            made here instead of shared memory.
+        fold_kwargs : dict
+            The remaining _cross_validate_fold arguments.
+
+        Returns
+        -------
+        fold_results : list of (int, dict)
+            The fold index and results of each completed fold, in fold
+            order.
+
+        """
+        path = None
+        if cache_dir is not None:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            path = tempfile.mkdtemp(prefix='cross_validate_', dir=cache_dir)
+        shared_dataset = SharedDataset(dataset, path=path)
+        # Each fold unpickles its own copy, like deepcopy in the serial case
+        network_bytes = pickle.dumps(network, 2)
+        fold_kwargs = dict(
+            fold_kwargs, fit_kwargs=dict(fold_kwargs['fit_kwargs'],
+                                         plot=False))
+        num_threads = max(1, (os.cpu_count() or 1) // n_jobs)
+        executor = ProcessPoolExecutor(
+            max_workers=n_jobs, mp_context=mp.get_context('spawn'))
+        futures = [
+            executor.submit(_cross_validate_worker, self, network_bytes,
+                            shared_dataset, fold_indices, fold,
+                            fold_kwargs, num_threads)
+            for fold in range(len(fold_indices))]
+        fold_results = []
+        try:
+            # Collected in fold order whichever fold finishes first
+            for fold, future in enumerate(futures):
+                fold_results.append((fold, future.result()))
+        except BaseException as e:
+            # Don't let the remaining folds train to completion, and stop
+            # the workers before the shared dataset is torn down under them
+            _stop_workers(executor, futures)
+            if not isinstance(e, KeyboardInterrupt):
+                raise
+            logger.info(
+                "\n\n***KeyboardInterrupt: Cross validate stopped "
+                "prematurely.***\n\n")
+            fold_results = [
+                (fold, future.result())
+                for fold, future in enumerate(futures)
+                if future.done() and not future.cancelled() and
+                future.exception() is None]
+        else:
+            executor.shutdown(wait=True)
+        finally:
+            shared_dataset.close()
+            if path is not None:
+                shutil.rmtree(path, ignore_errors=True)
+        return fold_results
+
+
+def _stop_workers(executor, futures):
+    """Cancel the pending futures of executor and end its worker processes."""
+    # shutdown drops the executor's reference to its processes
+    processes = list((getattr(executor, '_processes', None) or {}).values())
+    for future in futures:
+        future.cancel()
+    executor.shutdown(wait=False)
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def _cross_validate_worker(metrics, network_bytes, dataset, fold_indices,
+                           fold, fold_kwargs, num_threads):
+    """Entry point of the processes spawned by cross_validate(n_jobs=N)."""
+    # Split the cores between processes instead of oversubscribing them.
+    torch.set_num_threads(num_threads)
+    network = pickle.loads(network_bytes)
+    return metrics._cross_validate_fold(
+        network, dataset, fold_indices, fold, **fold_kwargs)
@@ -0,0 +1,448 @@
+# coding=utf-8
+"""Serve saved networks locally with dynamic micro-batching."""
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from .basenetwork import BaseNetwork
+
+import logging
+logger = logging.getLogger(__name__)
+
+_STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    500: 'Internal Server Error'
+}
+
+
+def _prepare_sample(sample, network):
+    """
+    Convert one sample to tensors and check it fits network.
+
+    Checking before queueing keeps a malformed request from failing the
+    other requests batched with it.
+
+    Parameters
+    ----------
+    sample : list or torch.Tensor
+        One input without the batch dimension, or a list of inputs
+        nested the same way as network.input_networks.
+    network : BaseNetwork
+        The network the sample is for.
+
+    Returns
+    -------
+    sample : torch.Tensor or list
+
+    Raises
+    ------
+    ValueError if sample doesn't match the network inputs.
+
+    """
+    if network.input_networks:
+        if not isinstance(sample, (list, tuple)) or \
+                len(sample) != len(network.input_networks):
+            raise ValueError(
+                "{} expects a list of {} inputs.".format(
+                    network.name, len(network.input_networks)))
+        return [_prepare_sample(s, in_net) for s, in_net in
+                zip(sample, network.input_networks.values())]
+    try:
+        tensor = torch.as_tensor(sample, dtype=torch.float)
+    except (TypeError, RuntimeError) as e:
+        raise ValueError("Malformed input for {}: {}".format(
+            network.name, e))
+    if tuple(tensor.shape) != tuple(network.in_dim):
+        raise ValueError(
+            "{} expects inputs of shape {}, got {}.".format(
+                network.name, tuple(network.in_dim), tuple(tensor.shape)))
+    return tensor
+
+
+def _collate(samples, network):
+    """
+    Stack single samples into one batch for network.
+
+    Multi-input samples are lists with one input per input network,
+    nested the same way as network.input_networks.
+
+    Parameters
+    ----------
+    samples : list
+        The samples, each without the batch dimension.
+    network : BaseNetwork
+        The network the batch is for.
+
+    Returns
+    -------
+    batch : torch.Tensor or list
+
+    """
+    if network.input_networks:
+        return [_collate([s[i] for s in samples], in_net)
+                for i, in_net in enumerate(network.input_networks.values())]
+    return torch.stack([
+        torch.as_tensor(s, dtype=torch.float) for s in samples]).to(
+            network.device)
+
+
+class InferenceServer(object):
+    """
+    Local inference service that coalesces concurrent requests into batches.
+
+    Single-sample requests are queued and run together through one
+    forward call once max_batch_size samples are waiting or the oldest
+    has waited max_wait_ms. Clients talk to it over HTTP on a TCP port
+    or a Unix socket:
+
+        POST /predict  {"inputs": sample}  ->  {"outputs": prediction}
+        GET  /stats                        ->  latency and throughput
+
+    where sample is the nested list of one input without the batch
+    dimension, or a list of such inputs for multi-input networks.
+
+    Parameters
+    ----------
+    network : BaseNetwork
+        The network to serve.
+    max_batch_size : int
+        The largest number of requests run in one forward call.
+    max_wait_ms : float
+        How long the first queued request waits for others to join it.
+    mixed_precision : boolean
+        Whether to run forward calls under bfloat16 autocast.
+    latency_window : int
+        How many of the latest request latencies the percentiles use.
+
+    Returns
+    -------
+    server : InferenceServer
+
+    """
+
+    def __init__(self, network, max_batch_size=32, max_wait_ms=5.0,
+                 mixed_precision=False, latency_window=10000):
+        """Initialize the server."""
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1.")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be >= 0.")
+        self.network = network
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.mixed_precision = mixed_precision
+        self.network.eval()
+
+        self._latencies = deque(maxlen=latency_window)
+        self._n_requests = 0
+        self._n_batches = 0
+        self._start_time = time.perf_counter()
+        self._queue = None
+        self._batch_task = None
+        # Forward calls run off the event loop, one batch at a time.
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    @classmethod
+    def from_saved(cls, load_path, **kwargs):
+        """
+        Create a server for a network saved with save_model.
+
+        Parameters
+        ----------
+        load_path : str
+            The directory the network was saved in.
+        kwargs : dict
+            Extra keyword arguments passed on to InferenceServer.
+
+        Returns
+        -------
+        server : InferenceServer
+
+        """
+        return cls(BaseNetwork.load_model(load_path), **kwargs)
+
+    async def predict(self, sample):
+        """
+        Queue one sample and wait for its prediction.
+
+        Parameters
+        ----------
+        sample : list or torch.Tensor
+            One input without the batch dimension, or a list of inputs
+            for multi-input networks.
+
+        Returns
+        -------
+        output : numpy.ndarray
+            The network output for sample, with softmax applied for
+            classification networks like forward_pass.
+
+        Raises
+        ------
+        ValueError if sample doesn't match the network inputs.
+
+        """
+        self._ensure_started()
+        sample = _prepare_sample(sample, self.network)
+        start = time.perf_counter()
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((sample, future))
+        output = await future
+        self._latencies.append(time.perf_counter() - start)
+        self._n_requests += 1
+        return output
+
+    def stats(self):
+        """
+        Return latency and throughput counters.
+
+        Returns
+        -------
+        stats : dict
+            Request and batch counts, mean batch size, p50 and p99
+            request latency in milliseconds and requests per second
+            since the server was created.
+
+        """
+        latencies = np.array(self._latencies) * 1000
+        elapsed = time.perf_counter() - self._start_time
+        return dict(
+            requests=self._n_requests,
+            batches=self._n_batches,
+            mean_batch_size=(self._n_requests / self._n_batches
+                             if self._n_batches else 0.0),
+            p50_latency_ms=(float(np.percentile(latencies, 50))
+                            if len(latencies) else None),
+            p99_latency_ms=(float(np.percentile(latencies, 99))
+                            if len(latencies) else None),
+            throughput=self._n_requests / elapsed if elapsed > 0 else 0.0)
+
+    async def start(self, host='127.0.0.1', port=8080, unix_path=None):
+        """
+        Start accepting HTTP connections.
+
+        Parameters
+        ----------
+        host : str
+            The interface to listen on.
+        port : int
+            The TCP port to listen on. 0 picks a free port.
+        unix_path : str or None
+            Listen on this Unix socket instead of host and port.
+
+        Returns
+        -------
+        server : asyncio.AbstractServer
+
+        """
+        self._ensure_started()
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(
+                self._handle_connection, path=unix_path)
+            logger.info("Serving {} on {}".format(
+                self.network.name, unix_path))
+        else:
+            server = await asyncio.start_server(
+                self._handle_connection, host=host, port=port)
+            logger.info("Serving {} on {}:{}".format(
+                self.network.name, host,
+                server.sockets[0].getsockname()[1]))
+        return server
+
+    def serve_forever(self, host='127.0.0.1', port=8080, unix_path=None):
+        """
+        Run the server until interrupted.
+
+        Parameters
+        ----------
+        host : str
+            The interface to listen on.
+        port : int
+            The TCP port to listen on.
+        unix_path : str or None
+            Listen on this Unix socket instead of host and port.
+
+        """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(
+            self.start(host=host, port=port, unix_path=unix_path))
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.run_until_complete(self.close())
+            loop.close()
+
+    async def close(self):
+        """
+        Stop batching requests and release the worker thread.
+
+        Requests still queued or running fail with a RuntimeError.
+
+        """
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            try:
+                await self._batch_task
+            except asyncio.CancelledError:
+                pass
+            self._batch_task = None
+            self._queue = None
+        self._executor.shutdown(wait=True)
+
+    def _ensure_started(self):
+        """Create the queue and batching task on the running loop."""
+        if self._batch_task is None:
+            self._queue = asyncio.Queue()
+            self._batch_task = asyncio.ensure_future(self._batch_loop())
+
+    async def _batch_loop(self):
+        """Collect queued requests into batches and run them."""
+        loop = asyncio.get_event_loop()
+        requests = []
+        try:
+            while True:
+                requests = [await self._queue.get()]
+                deadline = loop.time() + self.max_wait_ms / 1000
+                while len(requests) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        requests.append(await asyncio.wait_for(
+                            self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                samples = [sample for sample, _ in requests]
+                try:
+                    outputs = await loop.run_in_executor(
+                        self._executor, self._run_batch, samples)
+                except Exception as e:
+                    for _, future in requests:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                self._n_batches += 1
+                for (_, future), output in zip(requests, outputs):
+                    if not future.done():
+                        future.set_result(output)
+        except asyncio.CancelledError:
+            # Fail the batch in flight and everything still queued so
+            # no predict call waits forever on a closed server.
+            while not self._queue.empty():
+                requests.append(self._queue.get_nowait())
+            for _, future in requests:
+                if not future.done():
+                    future.set_exception(
+                        RuntimeError("InferenceServer was closed."))
+            raise
+
+    @torch.no_grad()
+    def _run_batch(self, samples):
+        """Run one forward call over the collated samples."""
+        data = _collate(samples, self.network)
+        with self.network._autocast(enabled=self.mixed_precision):
+            predictions = self.network(data)
+        predictions = predictions.float()
+        if self.network._num_classes:
+            predictions = nn.Softmax(dim=1)(predictions)
+        return predictions.cpu().numpy()
+
+    async def _handle_connection(self, reader, writer):
+        """Answer HTTP/1.1 requests on one connection."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(
+                    int(headers.get('content-length', 0)))
+
+                status, response = await self._route(method, path, body)
+                payload = json.dumps(response).encode('utf-8')
+                writer.write(
+                    'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n'
+                    'Content-Length: {}\r\n\r\n'.format(
+                        status, _STATUS_TEXT[status],
+                        len(payload)).encode('latin-1') + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body):
+        """Return the status and JSON response for one request."""
+        if path == '/stats':
+            if method != 'GET':
+                return 405, dict(error="Use GET for /stats.")
+            return 200, self.stats()
+        if path != '/predict':
+            return 404, dict(error="Unknown path {}.".format(path))
+        if method != 'POST':
+            return 405, dict(error="Use POST for /predict.")
+        try:
+            sample = json.loads(body.decode('utf-8'))['inputs']
+        except (ValueError, KeyError, TypeError):
+            return 400, dict(error='Expected a JSON body with "inputs".')
+        try:
+            output = await self.predict(sample)
+        except (ValueError, TypeError, RuntimeError) as e:
+            return 400, dict(error=str(e))
+        except Exception as e:
+            logger.exception("Prediction failed.")
+            return 500, dict(error=str(e))
+        return 200, dict(outputs=output.tolist())
+
+
+def main():
+    """Serve a saved network from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Serve a saved network with dynamic micro-batching.")
+    parser.add_argument('load_path',
+                        help="The directory the network was saved in.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix-path', default=None,
+                        help="Listen on this Unix socket instead.")
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--mixed-precision', action='store_true')
+    args = parser.parse_args()
+
+    server = InferenceServer.from_saved(
+        args.load_path,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        mixed_precision=args.mixed_precision)
+    server.serve_forever(
+        host=args.host, port=args.port, unix_path=args.unix_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,15 @@
 """Define utilities for all networks."""
 from math import ceil, floor
+import os
+import time
+import queue
+import signal
+import threading
+from contextlib import contextmanager
 import torch
 import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset, RandomSampler
+from torch.utils.data.distributed import DistributedSampler
 from torch.autograd import Variable
 
 import numpy as np
@@ -9,6 +17,9 @@ from sklearn.metrics import confusion_matrix
 from sklearn.preprocessing import LabelBinarizer
 from collections import OrderedDict as odict
 
+import logging
+logger = logging.getLogger(__name__)
+
 
 def round_list(raw_list, decimals=4):
     """
@@ -80,19 +91,38 @@ def pad(tensor, padded_shape):
     """
     # Ignore channels and batch and focus on spatial dimensions
     # from incoming tensor
-    if not isinstance(padded_shape, np.ndarray):
-        padded_shape = np.array(padded_shape)
     n_dim = len(padded_shape)
+    return F.pad(tensor, get_padding(tensor.shape[-n_dim:], padded_shape))
+
+
+def get_padding(shape, padded_shape):
+    """
+    Calculate the F.pad amounts that center shape within padded_shape.
+
+    Parameters
+    ----------
+    shape : list of int
+        The spatial dimensions to pad.
+    padded_shape : list of int
+        The spatial dimensions after padding.
+
+    Returns
+    -------
+    padding : list of int
+        Padding before and after each dimension, last dimension first,
+        in the format F.pad expects.
+
+    """
     # Calculate, element-wise, how much needs to be padded for each dim.
-    dims_size_diff = padded_shape - np.array(tensor.shape[-n_dim:])
-    # TODO: Use torch.nn.ConstantPadding?
+    dims_size_diff = np.array(padded_shape) - np.array(shape)
     padding_needed = []
     for dim_diff in reversed(dims_size_diff):
         dim_zero_padding = ceil(dim_diff/2)
         dim_one_padding = floor(dim_diff/2)
-        padding_needed.append(dim_zero_padding)
-        padding_needed.append(dim_one_padding)
-    return F.pad(tensor, padding_needed)
+        padding_needed.append(int(dim_zero_padding))
+        padding_needed.append(int(dim_one_padding))
+    return padding_needed
+
 
 def network_summary(network, input_size=None):
     """
@@ -186,7 +216,7 @@ def print_model_structure(network, input_size=None):
             for k2, v2 in v.items():
                 print('\t {}: {}'.format(k2, v2))
 
-def set_tensor_device(data, device=None):
+def set_tensor_device(data, device=None, non_blocking=False):
     """
     Helper function to convert list of data to
     relevant device
@@ -197,6 +227,9 @@ def set_tensor_device(data, device=None):
         data to be converted to the relevant device.
     device : str or torch.device
         the desired device
+    non_blocking : boolean
+        whether to copy asynchronously. Only has an effect
+        for pinned memory copied to an accelerator.
 
     Returns
     -------
@@ -205,12 +238,128 @@ def set_tensor_device(data, device=None):
 
     """
     if not isinstance(data, (list, tuple)):
-        data = data.to(device=device)
+        data = data.to(device=device, non_blocking=non_blocking)
     else:
         for idx, d in enumerate(data):
-            data[idx] = set_tensor_device(d, device=device)
+            data[idx] = set_tensor_device(
+                d, device=device, non_blocking=non_blocking)
+    return data
+
+def split_batch(data, n_chunks):
+    """
+    Helper function to split a batch into micro-batches
+    along the batch dimension.
+
+    Parameters
+    ----------
+    data : torch.tensor or list
+        data to be split. Nested lists (e.g. from a MultiDataset)
+        are split element-wise.
+    n_chunks : int
+        the number of micro-batches to split into
+
+    Returns
+    -------
+    chunks : list
+        n_chunks micro-batches, each with the same structure as data.
+        Chunks may be empty if the batch has fewer than n_chunks samples.
+
+    """
+    if not isinstance(data, (list, tuple)):
+        return list(torch.tensor_split(data, n_chunks))
+    split_items = [split_batch(d, n_chunks) for d in data]
+    return [list(chunk) for chunk in zip(*split_items)]
+
+def clone_tensors(data):
+    """
+    Helper function to copy every tensor in a nested
+    dict/list structure, such as a state_dict.
+
+    Parameters
+    ----------
+    data : torch.tensor, dict, list or tuple
+        data to be copied. Non-tensor leaves are returned as is.
+
+    Returns
+    -------
+    data : torch.tensor, dict, list or tuple
+        copy of data with every tensor detached and cloned
+
+    """
+    if torch.is_tensor(data):
+        return data.detach().clone()
+    if isinstance(data, dict):
+        return data.__class__(
+            (k, clone_tensors(v)) for k, v in data.items())
+    if isinstance(data, (list, tuple)):
+        return data.__class__(clone_tensors(d) for d in data)
     return data
 
+def shard_data_loader(data_loader, rank, world_size):
+    """
+    Helper function to rebuild a DataLoader so it only
+    yields this process's shard of the dataset.
+
+    Parameters
+    ----------
+    data_loader : torch.utils.data.DataLoader
+        the DataLoader to shard
+    rank : int
+        the rank of this process
+    world_size : int
+        the total number of processes
+
+    Returns
+    -------
+    data_loader : torch.utils.data.DataLoader
+        DataLoader over the same dataset using a DistributedSampler
+
+    """
+    sampler = DistributedSampler(
+        data_loader.dataset,
+        num_replicas=world_size,
+        rank=rank,
+        shuffle=isinstance(data_loader.sampler, RandomSampler))
+    return DataLoader(
+        data_loader.dataset,
+        batch_size=data_loader.batch_size,
+        sampler=sampler,
+        num_workers=data_loader.num_workers,
+        collate_fn=data_loader.collate_fn,
+        pin_memory=data_loader.pin_memory,
+        drop_last=data_loader.drop_last)
+
+def index_data_loader(data_loader):
+    """
+    Helper function to rebuild a DataLoader so each batch
+    also holds the dataset indices of its samples.
+
+    Parameters
+    ----------
+    data_loader : torch.utils.data.DataLoader
+        the DataLoader to index
+
+    Returns
+    -------
+    data_loader : torch.utils.data.DataLoader
+        DataLoader yielding (input_data, targets, indices) batches in
+        the same order, sharing the sampler of data_loader
+
+    """
+    if data_loader.batch_size is None:
+        batching = dict(batch_sampler=data_loader.batch_sampler)
+    else:
+        batching = dict(
+            batch_size=data_loader.batch_size,
+            sampler=data_loader.sampler,
+            drop_last=data_loader.drop_last)
+    return DataLoader(
+        IndexedDataset(data_loader.dataset),
+        num_workers=data_loader.num_workers,
+        collate_fn=data_loader.collate_fn,
+        pin_memory=data_loader.pin_memory,
+        **batching)
+
 def master_device_setter(network, device=None):
     """
     Helper function to convert the network and its 
@@ -227,4 +376,674 @@ def master_device_setter(network, device=None):
     network.device = device
     if network.input_networks:
         for net in network.input_networks.values():           
-            master_device_setter(net, device)
\ No newline at end of file
+            master_device_setter(net, device)
+
+class IndexedDataset(Dataset):
+    """
+    Wrap a dataset so each sample also returns its index.
+
+    Parameters
+    ----------
+    dataset : torch.utils.data.Dataset
+        The dataset of (input_data, target) samples to wrap.
+
+    Returns
+    -------
+    indexed_dataset : torch.utils.data.Dataset
+        Dataset of (input_data, target, index) samples.
+
+    """
+
+    def __init__(self, dataset):
+        """Initialize the indexed dataset."""
+        self.dataset = dataset
+
+    def __len__(self):
+        """Return the length of the wrapped dataset."""
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        """Return the sample at idx followed by idx."""
+        input_data, target = self.dataset[idx]
+        return input_data, target, idx
+
+
+def _flatten_sample(sample, leaves):
+    """Append the tensors of a nested sample to leaves, return its layout."""
+    if isinstance(sample, (list, tuple)):
+        return type(sample)(_flatten_sample(s, leaves) for s in sample)
+    leaves.append(torch.as_tensor(sample))
+    return len(leaves) - 1
+
+
+def _unflatten_sample(layout, leaves):
+    """Rebuild a nested sample from its layout and tensors."""
+    if isinstance(layout, (list, tuple)):
+        return type(layout)(_unflatten_sample(l, leaves) for l in layout)
+    return leaves[layout]
+
+
+class SharedDataset(Dataset):
+    """
+    Copy of a dataset that worker processes can read without pickling it.
+
+    Every sample is read once and stored column-wise, one array per
+    tensor in the sample, either in shared memory or in memory-mapped
+    .npy files. Processes it is sent to receive handles to the shared
+    memory or the file paths, not the data.
+
+    Parameters
+    ----------
+    dataset : torch.utils.data.Dataset
+        The dataset of (input_data, target) samples to copy. Every sample
+        must have the same structure and shapes.
+    path : str or None
+        Store the samples in memory-mapped .npy files in this directory
+        instead of in shared memory.
+
+    Returns
+    -------
+    shared_dataset : torch.utils.data.Dataset
+
+    """
+
+    def __init__(self, dataset, path=None):
+        """Copy every sample of dataset."""
+        self.path = path
+        self._n_samples = len(dataset)
+        if self._n_samples == 0:
+            raise ValueError("Can't share an empty dataset.")
+        leaves = []
+        self._layout = _flatten_sample(dataset[0], leaves)
+        if path is not None and not os.path.exists(path):
+            os.makedirs(path)
+        self._columns = []
+        for i, leaf in enumerate(leaves):
+            shape = (self._n_samples, *leaf.shape)
+            if path is None:
+                column = torch.empty(shape, dtype=leaf.dtype).share_memory_()
+            else:
+                column = np.lib.format.open_memmap(
+                    os.path.join(path, 'column_{}.npy'.format(i)),
+                    mode='w+', dtype=leaf.numpy().dtype, shape=shape)
+            self._columns.append(column)
+        for idx in range(self._n_samples):
+            leaves = []
+            _flatten_sample(dataset[idx], leaves)
+            for column, leaf in zip(self._columns, leaves):
+                column[idx] = leaf if path is None else leaf.numpy()
+        if path is not None:
+            for column in self._columns:
+                column.flush()
+
+    def __len__(self):
+        """Return the number of samples."""
+        return self._n_samples
+
+    def __getitem__(self, idx):
+        """Return the sample at idx."""
+        if self.path is None:
+            leaves = [column[idx] for column in self._columns]
+        else:
+            # Copy out of the read-only memory map
+            leaves = [torch.from_numpy(np.array(column[idx]))
+                      for column in self._columns]
+        return _unflatten_sample(self._layout, leaves)
+
+    def __getstate__(self):
+        """Send file paths instead of memory-mapped data."""
+        state = self.__dict__.copy()
+        if self.path is not None:
+            state['_columns'] = [column.filename
+                                 for column in self._columns]
+        return state
+
+    def __setstate__(self, state):
+        """Reopen memory-mapped columns read-only."""
+        self.__dict__.update(state)
+        if self.path is not None:
+            self._columns = [np.load(filename, mmap_mode='r')
+                             for filename in self._columns]
+
+    def close(self):
+        """Release the storage, deleting any memory-mapped files."""
+        columns, self._columns = self._columns, []
+        if self.path is not None:
+            for column in columns:
+                filename = column.filename
+                del column
+                if os.path.exists(filename):
+                    os.remove(filename)
+
+
+class EmbeddingCache(object):
+    """
+    Store the outputs of a network for each sample of a dataset.
+
+    Parameters
+    ----------
+    n_samples : int
+        The number of samples in the dataset.
+    shape : tuple
+        The output shape of the network, excluding the batch.
+    path : str or None
+        Store the outputs in a memory-mapped .npy file at path instead
+        of in memory.
+
+    Returns
+    -------
+    embedding_cache : EmbeddingCache
+
+    """
+
+    def __init__(self, n_samples, shape, path=None):
+        """Allocate storage for every sample."""
+        self.path = path
+        if path is None:
+            self._values = torch.empty([n_samples, *shape])
+        else:
+            self._values = torch.from_numpy(np.lib.format.open_memmap(
+                path, mode='w+', dtype=np.float32,
+                shape=(n_samples, *shape)))
+        self._filled = torch.zeros(n_samples, dtype=torch.bool)
+
+    def lookup(self, indices):
+        """
+        Return the stored outputs for indices.
+
+        Parameters
+        ----------
+        indices : torch.LongTensor
+            The dataset indices to look up.
+
+        Returns
+        -------
+        values : torch.Tensor or None
+            The outputs, on cpu, or None if any of them isn't stored.
+
+        """
+        indices = indices.cpu()
+        if not self._filled[indices].all():
+            return None
+        return self._values[indices]
+
+    def store(self, indices, values):
+        """
+        Store the outputs for indices.
+
+        Parameters
+        ----------
+        indices : torch.LongTensor
+            The dataset indices of values.
+        values : torch.Tensor
+            The outputs to store.
+
+        """
+        indices = indices.cpu()
+        self._values[indices] = values.detach().float().cpu()
+        self._filled[indices] = True
+
+    def close(self):
+        """Release the storage, deleting the memory-mapped file."""
+        self._values = None
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class EarlyStopping(object):
+    """
+    Stopping rule that keeps an in-memory copy of the best weights.
+
+    Parameters
+    ----------
+    name : str
+        The stopping rule. One of 'best_validation_error' or
+        'best_validation_accuracy'.
+    patience : int
+        How many validation checks without improvement to allow
+        before stopping.
+    min_delta : float
+        The minimum change in the monitored value that counts
+        as an improvement.
+
+    Returns
+    -------
+    early_stopping : EarlyStopping
+
+    """
+
+    # Maps each rule to the record key it monitors and whether
+    # a lower value is better.
+    _rules = {
+        'best_validation_error': ('validation_error', True),
+        'best_validation_accuracy': ('validation_accuracy', False)
+    }
+
+    def __init__(self, name='best_validation_error', patience=5,
+                 min_delta=0.0):
+        """Initialize the stopping rule."""
+        if name not in self._rules:
+            raise ValueError(
+                "Early stopping rule must be one of {}, got {}".format(
+                    list(self._rules), name))
+        if patience < 0:
+            raise ValueError("patience must be >= 0.")
+        self.name = name
+        self.monitor, self._lower_is_better = self._rules[name]
+        self.patience = patience
+        self.min_delta = abs(min_delta)
+        self.best_value = None
+        self.best_epoch = None
+        self.best_state = None
+        self.wait = 0
+
+    def _is_improvement(self, value):
+        if self.best_value is None:
+            return True
+        if self._lower_is_better:
+            return value < self.best_value - self.min_delta
+        return value > self.best_value + self.min_delta
+
+    def step(self, network):
+        """
+        Check the network's latest record entry against the best so far.
+
+        Snapshots the network weights whenever the monitored value improves.
+
+        Parameters
+        ----------
+        network : BaseNetwork
+            The network being trained.
+
+        Returns
+        -------
+        stop : boolean
+            Whether training should stop.
+
+        """
+        value = network.record[self.monitor][-1]
+        if np.isnan(value):
+            return False
+        if self._is_improvement(value):
+            self.best_value = value
+            self.best_epoch = network.record['epoch'][-1]
+            # Clone so later optimizer steps don't modify the snapshot.
+            self.best_state = clone_tensors(network.state_dict())
+            self.wait = 0
+            return False
+        self.wait += 1
+        return self.wait > self.patience
+
+    def restore(self, network):
+        """
+        Load the best weights seen back into the network.
+
+        Parameters
+        ----------
+        network : BaseNetwork
+            The network to restore.
+
+        """
+        if self.best_state is not None:
+            network.load_state_dict(self.best_state)
+
+
+class CheckpointWriter(object):
+    """
+    Write training checkpoints to disk on a background thread.
+
+    Only the newest submitted checkpoint is kept: if a new one arrives
+    before the previous one was written, the older one is dropped so
+    that the training thread never waits on disk.
+
+    Parameters
+    ----------
+    save_path : str
+        The directory to write checkpoints into.
+    file_name : str
+        The checkpoint file name inside save_path.
+
+    Returns
+    -------
+    checkpoint_writer : CheckpointWriter
+
+    """
+
+    def __init__(self, save_path, file_name='checkpoint.pt'):
+        """Create save_path and start the writer thread."""
+        os.makedirs(save_path, exist_ok=True)
+        self.file_path = os.path.join(save_path, file_name)
+        self._pending = None
+        self._closed = False
+        self._error = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name='CheckpointWriter', daemon=True)
+        self._thread.start()
+
+    def submit(self, checkpoint):
+        """
+        Queue a checkpoint to be written.
+
+        Parameters
+        ----------
+        checkpoint : dict
+            Already copied checkpoint contents. Must not be modified
+            by the caller afterwards.
+
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("CheckpointWriter is closed.")
+            self._pending = checkpoint
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                checkpoint, self._pending = self._pending, None
+            try:
+                self._write(checkpoint)
+            except Exception as e:
+                logger.error("Failed to write checkpoint {}: {}".format(
+                    self.file_path, e))
+                self._error = e
+
+    def _write(self, checkpoint):
+        # Write to a temporary file first so a crash mid-write
+        # never corrupts the last good checkpoint.
+        tmp_path = self.file_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            torch.save(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
+
+    def close(self):
+        """
+        Write any pending checkpoint and stop the writer thread.
+
+        Raises
+        ------
+        Exception raised by the last failed write, if any.
+
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+class DeferredInterrupt(object):
+    """
+    Record Ctrl-C instead of raising KeyboardInterrupt where it lands.
+
+    Used by distributed fit so that every rank can agree on an interrupt
+    at the end of an epoch instead of leaving its peers blocked in a
+    collective. A second Ctrl-C raises KeyboardInterrupt right away.
+    Only the main thread receives signals, so elsewhere, or if enabled
+    is False, this does nothing.
+
+    Parameters
+    ----------
+    enabled : boolean
+        Whether to defer interrupts.
+
+    Returns
+    -------
+    deferred_interrupt : DeferredInterrupt
+
+    """
+
+    def __init__(self, enabled=True):
+        """Create the flag, interrupts are intercepted once started."""
+        self.enabled = enabled and \
+            threading.current_thread() is threading.main_thread()
+        self.interrupted = False
+        self._previous_handler = None
+
+    def _handler(self, signum, frame):
+        if self.interrupted:
+            raise KeyboardInterrupt
+        self.interrupted = True
+
+    def start(self):
+        """Start recording interrupts."""
+        if self.enabled:
+            self._previous_handler = signal.signal(
+                signal.SIGINT, self._handler)
+
+    def stop(self):
+        """Restore the previous interrupt handler."""
+        if self._previous_handler is not None:
+            signal.signal(signal.SIGINT, self._previous_handler)
+            self._previous_handler = None
+
+
+class DataPrefetcher(object):
+    """
+    Wrap a DataLoader so the next batch is staged while the current one
+    is being computed on.
+
+    Batches are loaded on a background thread into a bounded queue. When
+    the device is a GPU, batches are also pinned on that thread and copied
+    to the device with non-blocking copies on a side stream, one batch
+    ahead of the consumer. Nested lists from a MultiDataset are handled.
+
+    Parameters
+    ----------
+    data_loader : torch.utils.data.DataLoader
+        The DataLoader to prefetch from.
+    device : str or torch.device
+        The device batches are moved to.
+    queue_size : int
+        How many loaded batches may wait in the queue.
+
+    Returns
+    -------
+    prefetcher : DataPrefetcher
+        Iterable yielding the DataLoader's batches already on device.
+
+    """
+
+    _end = object()
+
+    def __init__(self, data_loader, device, queue_size=2):
+        """Initialize the prefetcher."""
+        self.data_loader = data_loader
+        self.device = torch.device(device)
+        self.queue_size = queue_size
+        self.transfer_time = 0.0
+
+    def __len__(self):
+        """Return the number of batches of the wrapped DataLoader."""
+        return len(self.data_loader)
+
+    def __iter__(self):
+        """Yield batches moved to self.device."""
+        # Time spent issuing device copies on the consuming thread
+        self.transfer_time = 0.0
+        batches = self._load_batches()
+        if self.device.type != 'cuda':
+            for batch in batches:
+                start = time.perf_counter()
+                batch = set_tensor_device(batch, device=self.device)
+                self.transfer_time += time.perf_counter() - start
+                yield batch
+            return
+
+        stream = torch.cuda.Stream(device=self.device)
+        next_batch = self._stage(next(batches, self._end), stream)
+        while next_batch is not self._end:
+            torch.cuda.current_stream(self.device).wait_stream(stream)
+            batch = next_batch
+            # Stop the allocator from reusing this memory on the side
+            # stream while the compute stream still needs it.
+            _record_stream(batch, torch.cuda.current_stream(self.device))
+            next_batch = self._stage(next(batches, self._end), stream)
+            yield batch
+
+    def _stage(self, batch, stream):
+        if batch is self._end:
+            return batch
+        start = time.perf_counter()
+        with torch.cuda.stream(stream):
+            batch = set_tensor_device(
+                batch, device=self.device, non_blocking=True)
+        self.transfer_time += time.perf_counter() - start
+        return batch
+
+    def _load_batches(self):
+        """Yield host batches loaded ahead of time by a worker thread."""
+        batches = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        pin = self.device.type == 'cuda'
+
+        def put(item):
+            # Give up if the consumer went away so the thread can exit.
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for batch in self.data_loader:
+                    batch = list(batch)
+                    if pin:
+                        batch = _pin_memory(batch)
+                    if not put(batch):
+                        return
+                put(self._end)
+            except Exception as e:
+                put(_LoaderError(e))
+
+        thread = threading.Thread(
+            target=produce, name='DataPrefetcher', daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is self._end:
+                    return
+                if isinstance(batch, _LoaderError):
+                    raise batch.error
+                yield batch
+        finally:
+            stop.set()
+
+
+class _LoaderError(object):
+    """Carry an exception from the loading thread to the consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _pin_memory(data):
+    if not isinstance(data, (list, tuple)):
+        return data.pin_memory()
+    return [_pin_memory(d) for d in data]
+
+
+def _record_stream(data, stream):
+    if not isinstance(data, (list, tuple)):
+        data.record_stream(stream)
+    else:
+        for d in data:
+            _record_stream(d, stream)
+
+
+class PhaseTimer(object):
+    """
+    Accumulate the wall-clock time spent in each phase of an epoch.
+
+    Parameters
+    ----------
+    sync_device : str, torch.device or None
+        If a GPU device is given, it is synchronized at the end of every
+        phase so asynchronous kernels are attributed to the phase that
+        launched them. Leave as None to avoid the synchronization cost.
+
+    Returns
+    -------
+    phase_timer : PhaseTimer
+
+    """
+
+    def __init__(self, sync_device=None):
+        """Start the epoch clock."""
+        self.phase_times = odict()
+        self._sync_device = None
+        if sync_device is not None and \
+                torch.device(sync_device).type == 'cuda':
+            self._sync_device = sync_device
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time the enclosed block and add it to phase `name`.
+
+        Parameters
+        ----------
+        name : str
+            The phase name.
+
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self._sync_device is not None:
+                torch.cuda.synchronize(self._sync_device)
+            self.phase_times[name] = self.phase_times.get(name, 0.0) + \
+                time.perf_counter() - start
+
+    def split(self, name, new_name, seconds):
+        """
+        Move `seconds` of phase `name` into phase `new_name`.
+
+        Parameters
+        ----------
+        name : str
+            The phase that included the time.
+        new_name : str
+            The phase to attribute the time to.
+        seconds : float
+            The time to move.
+
+        """
+        seconds = min(seconds, self.phase_times.get(name, 0.0))
+        self.phase_times[name] = self.phase_times.get(name, 0.0) - seconds
+        self.phase_times[new_name] = \
+            self.phase_times.get(new_name, 0.0) + seconds
+
+    def summary(self, n_samples):
+        """
+        Return the throughput and time per phase since the timer started.
+
+        Parameters
+        ----------
+        n_samples : int
+            The number of samples processed.
+
+        Returns
+        -------
+        timing : dict
+            samples_per_sec and phase_times, a dict of seconds per phase.
+
+        """
+        elapsed = time.perf_counter() - self._start
+        return dict(
+            samples_per_sec=n_samples / elapsed if elapsed > 0 else np.nan,
+            phase_times=dict(self.phase_times))
@@ -2,7 +2,10 @@
 import pytest
 import numpy as np
 import torch
+from copy import deepcopy
 from vulcanai2.models.cnn import ConvNet
+from vulcanai2.models.dnn import DenseNet
+from vulcanai2.datasets import MultiDataset
 from torch.utils.data import TensorDataset, DataLoader
 
 
@@ -112,3 +115,235 @@ class TestConvNet:
         cnn_class.add_input_network(cnn_noclass)
         assert cnn_class.input_networks[cnn_noclass.name] is cnn_noclass
         assert cnn_class.in_dim == cnn_noclass.out_dim
+
+    def test_merge_plan(self, cnn_noclass):
+        """Merge plan is rebuilt when input networks are added."""
+        dense_input = DenseNet(
+            name='Test_DenseNet_input',
+            in_dim=(10),
+            config={'dense_units': [30]})
+        multi_cnn = ConvNet(
+            name='Test_ConvNet_multi',
+            input_networks=[cnn_noclass],
+            config={
+                'conv_units': [
+                    {
+                        "in_channels": 1,
+                        "out_channels": 4,
+                        "kernel_size": (3, 3),
+                        "padding": 1
+                    }]
+            }
+        )
+        assert len(multi_cnn._merge_plan) == 1
+        multi_cnn.add_input_network(dense_input)
+        assert len(multi_cnn._merge_plan) == 2
+        # 30 features padded to 36 and spread over 4 channels of 3x3
+        assert multi_cnn._merge_plan[1] == (None, [3, 3], (4, 3, 3))
+        assert multi_cnn.in_dim == (5, 3, 3)
+        merged = multi_cnn._merge_input_network_outputs([
+            torch.ones([2, *cnn_noclass.out_dim]), torch.ones([2, 30])])
+        assert merged.shape == (2, 5, 3, 3)
+        assert merged[:, 1:].sum() == 2 * 30
+
+    def test_fit_mixed_precision(self, cnn_noclass):
+        """Train a multi-input network under bfloat16 autocast."""
+        multi_cnn = ConvNet(
+            name='Test_ConvNet_multi',
+            input_networks=[cnn_noclass],
+            config={
+                'conv_units': [
+                    {
+                        "in_channels": 1,
+                        "out_channels": 4,
+                        "kernel_size": (3, 3),
+                        "padding": 1
+                    }]
+            },
+            num_classes=3
+        )
+        test_input = torch.ones([4, *cnn_noclass.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 0])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_target), batch_size=2)
+        multi_cnn.fit(
+            train_loader=test_dataloader,
+            val_loader=test_dataloader,
+            epochs=1,
+            mixed_precision=True)
+        # Master weights stay in full precision
+        for params in multi_cnn.parameters():
+            assert params.dtype == torch.float32
+        assert not np.isnan(multi_cnn.record['train_error'][-1])
+        output = multi_cnn.forward_pass(
+            data_loader=test_dataloader,
+            mixed_precision=True)
+        assert output.dtype == np.float32
+        assert output.shape == (4, multi_cnn._num_classes)
+
+    def test_compile(self, cnn_noclass):
+        """Compiled multi-input networks match eager outputs."""
+        multi_dnn = DenseNet(
+            name='Test_DenseNet_multi',
+            input_networks=[cnn_noclass],
+            config={
+                'dense_units': [10],
+            },
+            num_classes=3
+        )
+        test_input = torch.rand([4, *cnn_noclass.in_dim])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_input), batch_size=2)
+        eager_output = multi_dnn.forward_pass(test_dataloader)
+        assert multi_dnn.compile(backend='eager')
+        assert cnn_noclass._compiled_network is not None
+        assert multi_dnn._compiled_merge is not None
+        compiled_output = multi_dnn.forward_pass(test_dataloader)
+        assert np.allclose(eager_output, compiled_output, atol=1e-6)
+        # Compiled graphs don't leak into the weights or copies
+        assert multi_dnn.state_dict().keys() == \
+            deepcopy(multi_dnn).state_dict().keys()
+        assert deepcopy(multi_dnn)._compiled_network is None
+
+    def test_compile_fallback(self, cnn_class):
+        """Failed compilation leaves the network in eager mode."""
+        assert not cnn_class.compile(backend='not_a_backend')
+        assert cnn_class._compiled_network is None
+        output = cnn_class(torch.ones([2, *cnn_class.in_dim]))
+        assert output.shape == (2, cnn_class._num_classes)
+
+    def test_quantize(self, cnn_class):
+        """Quantized copy keeps predictions close and works with run_test."""
+        test_input = torch.rand([10, *cnn_class.in_dim])
+        test_target = torch.LongTensor([0, 1, 2, 0, 1, 2, 0, 1, 2, 0])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_target), batch_size=5)
+        quantized = cnn_class.quantize(calibration_loader=test_dataloader)
+        assert quantized is not cnn_class
+        assert isinstance(
+            quantized.network.classify._kernel,
+            torch.ao.nn.quantized.dynamic.Linear)
+        assert isinstance(
+            quantized.network.conv_0._kernel.module,
+            torch.ao.nn.quantized.Conv2d)
+        for key in ['size_reduction', 'latency_reduction']:
+            assert key in quantized.quantization_report
+        float_output = cnn_class.cpu().forward_pass(test_dataloader)
+        assert np.allclose(
+            quantized.forward_pass(test_dataloader), float_output, atol=0.1)
+        assert 'accuracy' in quantized.run_test(test_dataloader)
+
+    def test_fuse_for_inference(self):
+        """Fused copy matches the network on normalized inputs."""
+        cnn_norm = ConvNet(
+            name='Test_ConvNet_norm',
+            in_dim=(2, 12, 12),
+            config={
+                'conv_units': [
+                    {
+                        "in_channels": 2,
+                        "out_channels": 8,
+                        "kernel_size": (3, 3),
+                        "norm": 'batch',
+                        "pool_size": 2,
+                        "dropout": 0.3
+                    },
+                    {
+                        "in_channels": 8,
+                        "out_channels": 4,
+                        "kernel_size": (3, 3),
+                        "norm": 'batch',
+                        "padding": 1
+                    }]
+            },
+            num_classes=3
+        )
+        # Populate the batch norm running stats
+        cnn_norm(torch.rand([8, *cnn_norm.in_dim]) * 3)
+        cnn_norm.eval()
+        fused = cnn_norm.fuse_for_inference(
+            input_mean=[0.1, 0.5], input_std=[0.3, 2.0])
+        for unit in fused.network[:2]:
+            assert not hasattr(unit, '_norm')
+            assert not hasattr(unit, '_dropout')
+        test_input = torch.rand([5, *cnn_norm.in_dim])
+        normalized = (test_input - torch.tensor([0.1, 0.5]).view(2, 1, 1)) \
+            / torch.tensor([0.3, 2.0]).view(2, 1, 1)
+        assert torch.allclose(
+            fused(test_input), cnn_norm(normalized), atol=1e-5)
+
+    def test_parallelize_inputs(self, cnn_noclass):
+        """Concurrent input branches match sequential outputs and grads."""
+        branches = [deepcopy(cnn_noclass) for _ in range(3)]
+        for idx, branch in enumerate(branches):
+            branch.name = 'branch_{}'.format(idx)
+        nested_dnn = DenseNet(
+            name='Test_DenseNet_nested',
+            input_networks=branches[:2],
+            config={'dense_units': [10]})
+        multi_dnn = DenseNet(
+            name='Test_DenseNet_multi',
+            input_networks=[nested_dnn, branches[2]],
+            config={'dense_units': [4]},
+            num_classes=2)
+        test_input = [
+            [torch.rand([3, *cnn_noclass.in_dim]) for _ in range(2)],
+            torch.rand([3, *cnn_noclass.in_dim])]
+
+        multi_dnn(test_input).sum().backward()
+        grads = [p.grad.clone() for p in multi_dnn.parameters()]
+        multi_dnn.zero_grad()
+        sequential_output = multi_dnn(test_input)
+
+        multi_dnn.parallelize_inputs()
+        assert nested_dnn._get_input_executor() is not None
+        parallel_output = multi_dnn(test_input)
+        assert torch.allclose(parallel_output, sequential_output)
+        parallel_output.sum().backward()
+        for params, grad in zip(multi_dnn.parameters(), grads):
+            assert torch.allclose(params.grad, grad)
+        with torch.no_grad():
+            assert not multi_dnn(test_input).requires_grad
+        with torch.autocast(device_type='cpu', dtype=torch.bfloat16):
+            assert multi_dnn(test_input).dtype == torch.bfloat16
+        assert deepcopy(multi_dnn)._parallel_inputs
+
+    @pytest.mark.parametrize('use_memmap', [False, True])
+    def test_embedding_cache(self, cnn_noclass, tmp_path, use_memmap):
+        """Frozen input networks only run in the first epoch."""
+        frozen_branch = deepcopy(cnn_noclass)
+        frozen_branch.name = 'frozen_branch'
+        frozen_branch.freeze()
+        multi_dnn = DenseNet(
+            name='Test_DenseNet_multi',
+            input_networks=[frozen_branch, cnn_noclass],
+            config={'dense_units': [4]},
+            num_classes=2)
+        multi_dnn.enable_embedding_cache(
+            cache_dir=str(tmp_path) if use_memmap else None)
+        n_calls = []
+        frozen_branch.register_forward_hook(
+            lambda module, inputs, output: n_calls.append(len(output)))
+        test_input = [torch.rand([6, *cnn_noclass.in_dim]) for _ in range(2)]
+        test_dataloader = DataLoader(
+            MultiDataset([
+                (TensorDataset(test_input[0]), True, False),
+                (TensorDataset(test_input[1], torch.LongTensor(
+                    [0, 1, 0, 1, 0, 1])), True, True)]),
+            batch_size=2, shuffle=True)
+        multi_dnn.fit(train_loader=test_dataloader,
+                      val_loader=test_dataloader, epochs=3)
+        # Once per sample, training and validation share the dataset
+        assert sum(n_calls) == 6
+        assert len(list(tmp_path.iterdir())) == (1 if use_memmap else 0)
+
+        multi_dnn.eval()
+        with torch.no_grad():
+            expected = multi_dnn(test_input)
+            cache = multi_dnn._get_embedding_caches(
+                test_dataloader.dataset)
+            cached = multi_dnn(test_input, embedding_caches=cache,
+                               cache_keys=torch.arange(6))
+        assert torch.allclose(cached, expected, atol=1e-6)
+        multi_dnn.clear_embedding_cache()
+        assert not list(tmp_path.iterdir())
@@ -2,7 +2,7 @@
 import pytest
 
 from vulcanai2.models import ConvNet, DenseNet
-from vulcanai2.models.utils import master_device_setter
+from vulcanai2.models.utils import master_device_setter, DataPrefetcher
 from vulcanai2.datasets import MultiDataset
 
 import torch
@@ -201,3 +201,38 @@ class TestDevice:
                 plot=False)
 
         assert str(e_info.value).endswith("{'conv3D_net': device(type='cpu')}")
+
+    def test_prefetcher_multi_input(self, conv1D_net, conv2D_net):
+        """Prefetched nested multi-input batches match the DataLoader's."""
+        multi_data = MultiDataset([
+            (TensorDataset(torch.rand([10, *conv1D_net.in_dim])),
+             True, False),
+            MultiDataset([
+                (TensorDataset(
+                    torch.rand([10, *conv2D_net.in_dim]),
+                    torch.arange(10)), True, True)
+            ])
+        ])
+        data_loader = DataLoader(multi_data, batch_size=3)
+        prefetched = list(DataPrefetcher(data_loader, 'cpu'))
+        expected = list(data_loader)
+        assert len(prefetched) == len(expected) == 4
+        for (data, targets), (exp_data, exp_targets) in \
+                zip(prefetched, expected):
+            assert torch.equal(targets, exp_targets)
+            assert torch.equal(data[0], exp_data[0])
+            assert torch.equal(data[1][0], exp_data[1][0])
+
+    def test_prefetcher_raises_loader_errors(self):
+        """Errors while loading are raised in the consuming thread."""
+        class BrokenDataset(TensorDataset):
+            def __getitem__(self, idx):
+                if idx == 3:
+                    raise IndexError("broken sample")
+                return super(BrokenDataset, self).__getitem__(idx)
+
+        data_loader = DataLoader(
+            BrokenDataset(torch.ones([6, 2]), torch.ones([6])),
+            batch_size=2)
+        with pytest.raises(IndexError):
+            list(DataPrefetcher(data_loader, 'cpu'))
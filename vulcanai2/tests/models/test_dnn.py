@@ -1,9 +1,14 @@
 """Test all DenseNet capabilities."""
 import pytest
+import logging
+import json
+import os
+import signal
 import numpy as np
 import torch
+from copy import deepcopy
 from vulcanai2.models.dnn import DenseNet
-from torch.utils.data import TensorDataset, DataLoader
+from torch.utils.data import TensorDataset, DataLoader, RandomSampler
 
 
 class TestDenseNet:
@@ -55,6 +60,120 @@ class TestDenseNet:
         assert np.any(~np.isnan(raw_output))
         assert np.any(~np.isnan(class_output))
 
+    def test_iter_forward_pass(self, dnn_class):
+        """Streamed batches match the preallocated forward_pass output."""
+        test_input = torch.rand([5, *dnn_class.in_dim])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_input), batch_size=2)
+        batches = list(dnn_class.iter_forward_pass(test_dataloader))
+        assert [len(b) for b in batches] == [2, 2, 1]
+        output = dnn_class.forward_pass(test_dataloader)
+        assert output.shape == (5, *dnn_class.out_dim)
+        assert np.allclose(np.concatenate(batches), output)
+        class_output = dnn_class.forward_pass(
+            test_dataloader, convert_to_class=True)
+        assert np.array_equal(class_output, output.argmax(axis=1))
+
+    def test_forward_pass_oversampled(self, dnn_class):
+        """Samplers yielding more rows than the dataset holds fit."""
+        test_input = torch.rand([5, *dnn_class.in_dim])
+        dataset = TensorDataset(test_input, test_input)
+        test_dataloader = DataLoader(
+            dataset, batch_size=4, sampler=RandomSampler(
+                dataset, replacement=True, num_samples=11))
+        output = dnn_class.forward_pass(test_dataloader)
+        assert output.shape == (11, *dnn_class.out_dim)
+
+    def test_forward_pass_top_k_threshold(self, dnn_class):
+        """Top-k and threshold outputs agree with the probabilities."""
+        test_input = torch.rand([5, *dnn_class.in_dim])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_input), batch_size=2)
+        probabilities = dnn_class.forward_pass(test_dataloader)
+        classes, top_probabilities = dnn_class.forward_pass(
+            test_dataloader, top_k=2)
+        assert classes.shape == top_probabilities.shape == (5, 2)
+        assert np.array_equal(classes[:, 0], probabilities.argmax(axis=1))
+        assert np.allclose(
+            top_probabilities,
+            np.take_along_axis(probabilities, classes, axis=1))
+        above = dnn_class.forward_pass(test_dataloader, threshold=0.3)
+        assert above.dtype == np.bool_
+        assert np.array_equal(above, probabilities >= 0.3)
+        with pytest.raises(ValueError):
+            dnn_class.forward_pass(
+                test_dataloader, convert_to_class=True, top_k=1)
+
+    def test_forward_pass_workers(self, dnn_class):
+        """Sharded forward_pass matches the single process outputs."""
+        dnn_class.device = 'cpu'
+        test_input = torch.rand([7, *dnn_class.in_dim])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_input), batch_size=2)
+        expected = dnn_class.forward_pass(test_dataloader)
+        output = dnn_class.forward_pass(test_dataloader, workers=2)
+        assert np.allclose(output, expected, atol=1e-6)
+        assert not any(p.is_shared() for p in dnn_class.parameters())
+        class_output = dnn_class.forward_pass(
+            test_dataloader, convert_to_class=True, workers=3)
+        assert np.array_equal(class_output, expected.argmax(axis=1))
+        with pytest.raises(ValueError):
+            dnn_class.forward_pass(
+                DataLoader(TensorDataset(test_input, test_input),
+                           shuffle=True),
+                workers=2)
+
+    def test_forward_pass_return_targets(self, dnn_class):
+        """Targets come back in order alongside the outputs."""
+        dnn_class.device = 'cpu'
+        test_input = torch.rand([7, *dnn_class.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 1, 0, 2, 1])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_target), batch_size=2)
+        expected = dnn_class.forward_pass(test_dataloader)
+        for workers in [1, 2]:
+            output, targets = dnn_class.forward_pass(
+                test_dataloader, return_targets=True, workers=workers)
+            assert np.allclose(output, expected, atol=1e-6)
+            assert targets.dtype == np.int64
+            assert np.array_equal(targets, test_target.numpy())
+
+    def test_score_to_disk(self, dnn_class, tmp_path):
+        """Outputs written to disk match forward_pass and resume."""
+        test_input = torch.rand([7, *dnn_class.in_dim])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_input), batch_size=2)
+        expected = dnn_class.forward_pass(test_dataloader)
+
+        manifest = dnn_class.score_to_disk(
+            test_dataloader, str(tmp_path / 'memmap'))
+        assert manifest['n_completed'] == 7
+        assert np.allclose(
+            np.load(str(tmp_path / 'memmap' / 'predictions.npy')), expected)
+
+        shard_path = tmp_path / 'shards'
+        manifest = dnn_class.score_to_disk(
+            test_dataloader, str(shard_path), shard_size=3)
+        assert manifest['files'] == [
+            'shard_00000.npy', 'shard_00001.npy', 'shard_00002.npy']
+        # Pretend the job died after the first shard
+        manifest['files'] = manifest['files'][:1]
+        manifest['n_completed'] = 3
+        with open(str(shard_path / 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        n_scored = []
+        dnn_class.register_forward_hook(
+            lambda module, inputs, output: n_scored.append(len(output)))
+        manifest = dnn_class.score_to_disk(
+            test_dataloader, str(shard_path), shard_size=3)
+        assert sum(n_scored) == 4
+        assert np.allclose(np.concatenate([
+            np.load(str(shard_path / f)) for f in manifest['files']]),
+            expected)
+        with pytest.raises(ValueError):
+            dnn_class.score_to_disk(
+                test_dataloader, str(shard_path), shard_size=4)
+
     def test_freeze_class(self, dnn_class):
         """Test class network freezing."""
         dnn_class.freeze(apply_inputs=False)
@@ -86,3 +205,203 @@ class TestDenseNet:
         dnn_class.add_input_network(dnn_noclass)
         assert dnn_class.input_networks[dnn_noclass.name] is dnn_noclass
         assert dnn_class.in_dim == dnn_noclass.out_dim
+
+    def test_fit_accumulate_steps(self):
+        """Micro-batched gradients match those of the whole batch."""
+        dnn = DenseNet(
+            name='Test_DenseNet_accumulate',
+            in_dim=(10),
+            config={
+                'dense_units': [8],
+            },
+            optim_spec={'name': 'SGD', 'lr': 0.1},
+            num_classes=3
+        )
+        dnn_micro = deepcopy(dnn)
+        test_input = torch.rand([7, *dnn.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 0, 1, 2, 2])
+        # Ragged last batch of 3 split across 2 micro-batches
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_target), batch_size=4)
+        dnn.fit(test_dataloader, test_dataloader, epochs=1)
+        dnn_micro.fit(test_dataloader, test_dataloader, epochs=1,
+                      accumulate_steps=2)
+        for params, micro_params in zip(dnn.parameters(),
+                                        dnn_micro.parameters()):
+            assert torch.allclose(params, micro_params, atol=1e-6)
+        assert dnn.record['train_error'] == \
+            pytest.approx(dnn_micro.record['train_error'])
+
+    def test_fit_early_stopping(self):
+        """Training stops once validation error stops improving."""
+        dnn = DenseNet(
+            name='Test_DenseNet_early_stopping',
+            in_dim=(10),
+            config={
+                'dense_units': [8],
+            },
+            # No updates so validation error never improves
+            optim_spec={'name': 'SGD', 'lr': 0.0},
+            early_stopping={'name': 'best_validation_error', 'patience': 2},
+            num_classes=3
+        )
+        test_input = torch.rand([6, *dnn.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 0, 1, 2])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_target), batch_size=3)
+        dnn.fit(test_dataloader, test_dataloader, epochs=10,
+                valid_interv=1)
+        # First check sets the best, then patience + 1 checks to stop
+        assert dnn.record['epoch'] == [0, 1, 2, 3]
+
+    def test_fit_early_stopping_interrupted(self, caplog):
+        """Nothing is restored when no epoch was validated."""
+        dnn = DenseNet(
+            name='Test_DenseNet_early_stopping',
+            in_dim=(10),
+            config={
+                'dense_units': [8],
+            },
+            early_stopping={'name': 'best_validation_error', 'patience': 2},
+            num_classes=3
+        )
+        test_input = torch.rand([6, *dnn.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 0, 1, 2])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_target), batch_size=3)
+
+        def interrupt(module, inputs, output):
+            raise KeyboardInterrupt
+
+        dnn.register_forward_hook(interrupt)
+        caplog.set_level(logging.INFO)
+        dnn.fit(test_dataloader, test_dataloader, epochs=2)
+        assert 'Restoring weights' not in caplog.text
+
+    def test_fit_checkpoint(self, dnn_class, tmp_path):
+        """Checkpoints written during fit restore the training state."""
+        test_input = torch.rand([6, *dnn_class.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 0, 1, 2])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_target), batch_size=3)
+        resumed_dnn = deepcopy(dnn_class)
+        dnn_class.fit(test_dataloader, test_dataloader, epochs=2,
+                      checkpoint_path=str(tmp_path), checkpoint_interv=1)
+        resumed_dnn.load_checkpoint(str(tmp_path))
+        assert resumed_dnn.epoch == dnn_class.epoch == 2
+        assert resumed_dnn.record['epoch'] == dnn_class.record['epoch']
+        for params, resumed_params in zip(dnn_class.parameters(),
+                                          resumed_dnn.parameters()):
+            assert torch.equal(params, resumed_params)
+        assert resumed_dnn.optim.state_dict()['state'].keys() == \
+            dnn_class.optim.state_dict()['state'].keys()
+
+    def test_fit_workers(self):
+        """Multi-process training averages gradients across shards."""
+        dnn = DenseNet(
+            name='Test_DenseNet_workers',
+            in_dim=(10),
+            config={
+                'dense_units': [8],
+            },
+            optim_spec={'name': 'SGD', 'lr': 0.1},
+            num_classes=3,
+            device='cpu'
+        )
+        single_dnn = deepcopy(dnn)
+        test_input = torch.rand([8, *dnn.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 0, 1, 2, 1, 0])
+        test_dataset = TensorDataset(test_input, test_target)
+        dnn.fit(DataLoader(test_dataset, batch_size=2),
+                DataLoader(test_dataset, batch_size=2),
+                epochs=2, workers=2)
+        # Two shards of 2 samples per step equal one batch of 4
+        single_dnn.fit(DataLoader(test_dataset, batch_size=4),
+                       DataLoader(test_dataset, batch_size=2),
+                       epochs=2)
+        assert dnn.record['epoch'] == [0, 1]
+        assert dnn.record['train_error'] == \
+            pytest.approx(single_dnn.record['train_error'])
+        for params, single_params in zip(dnn.parameters(),
+                                         single_dnn.parameters()):
+            assert torch.allclose(params, single_params, atol=1e-6)
+
+    def test_fit_workers_interrupted(self):
+        """Ctrl-C on one rank stops every rank after the same epoch."""
+        dnn = DenseNet(
+            name='Test_DenseNet_workers',
+            in_dim=(10),
+            config={
+                'dense_units': [8],
+            },
+            num_classes=3,
+            device='cpu'
+        )
+        # Epoch hooks only run on rank 0
+        dnn.register_epoch_hook(
+            lambda network, epoch_record: os.kill(os.getpid(), signal.SIGINT))
+        test_input = torch.rand([8, *dnn.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 0, 1, 2, 1, 0])
+        test_dataset = TensorDataset(test_input, test_target)
+        handler = signal.getsignal(signal.SIGINT)
+        dnn.fit(DataLoader(test_dataset, batch_size=2),
+                DataLoader(test_dataset, batch_size=2),
+                epochs=5, workers=2)
+        assert dnn.record['epoch'] == [0]
+        assert signal.getsignal(signal.SIGINT) is handler
+
+    def test_find_lr(self, dnn_class):
+        """LR range test suggests a rate and leaves the weights untouched."""
+        initial_state = deepcopy(dnn_class.state_dict())
+        test_input = torch.rand([6, *dnn_class.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 0, 1, 2])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_target), batch_size=2)
+        suggested_lr, lr_record = dnn_class.find_lr(
+            test_dataloader, start=1e-5, end=1, num_steps=10)
+        assert 1e-5 <= suggested_lr <= 1
+        assert len(lr_record['lr']) == len(lr_record['loss']) <= 10
+        assert lr_record['lr'] == sorted(lr_record['lr'])
+        assert dnn_class.optim is None
+        for k, v in dnn_class.state_dict().items():
+            assert torch.equal(v, initial_state[k])
+
+    def test_fit_phase_timing(self, dnn_class):
+        """Fit records per-phase timings and calls epoch hooks."""
+        test_input = torch.rand([6, *dnn_class.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 0, 1, 2])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_target), batch_size=2)
+        epoch_records = []
+        handle = dnn_class.register_epoch_hook(
+            lambda network, record: epoch_records.append(record))
+        dnn_class.fit(train_loader=test_dataloader,
+                      val_loader=test_dataloader,
+                      epochs=2, valid_interv=2)
+        assert [r['epoch'] for r in epoch_records] == [0, 1]
+        assert dnn_class.record['train_samples_per_sec'][-1] > 0
+        # Only epoch 0 is validated with valid_interv=2
+        assert np.isnan(dnn_class.record['validation_samples_per_sec'][1])
+        assert dnn_class.record['validation_phase_times'][1] == {}
+        for phase in ['data_wait', 'transfer', 'forward', 'loss',
+                      'backward', 'optimizer', 'metrics']:
+            assert phase in dnn_class.record['train_phase_times'][-1]
+        assert 'backward' not in dnn_class.record['validation_phase_times'][0]
+        handle.remove()
+        dnn_class.fit(train_loader=test_dataloader,
+                      val_loader=test_dataloader, epochs=1)
+        assert len(epoch_records) == 2
+
+    def test_fit_old_record(self, dnn_class):
+        """Networks pickled before timing was recorded still fit."""
+        test_input = torch.rand([4, *dnn_class.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 0])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_target), batch_size=2)
+        for key in ['train_samples_per_sec', 'validation_samples_per_sec',
+                    'train_phase_times', 'validation_phase_times']:
+            del dnn_class.record[key]
+        del dnn_class._epoch_hooks
+        dnn_class.fit(train_loader=test_dataloader,
+                      val_loader=test_dataloader, epochs=1)
+        assert len(dnn_class.record['train_samples_per_sec']) == 1
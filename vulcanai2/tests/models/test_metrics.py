@@ -1,8 +1,12 @@
 import pytest
+import pickle
 import numpy as np
 import torch
-from vulcanai2.models.metrics import Metrics
+from vulcanai2.models.metrics import (Metrics, MetricAccumulator,
+                                      ConfusionMatrix, StreamingAUC)
+from sklearn import metrics as skl_metrics
 from vulcanai2.models.cnn import ConvNet
+from vulcanai2.models.utils import SharedDataset
 from vulcanai2.models.dnn import DenseNet
 from vulcanai2.models.ensemble import SnapshotNet
 from torch.utils.data import TensorDataset, DataLoader
@@ -50,6 +54,148 @@ class TestMetrics:
         output = metrics.extract_class_labels(test_input)
         assert np.all(output == np.array([1, 0, 1]))
 
+    def test_metric_accumulator(self, metrics):
+        """Accumulated values match per-batch sklearn calculations."""
+        predictions = torch.tensor([
+            [0.2, 0.8, 0.0],
+            [0.7, 0.3, 0.0],
+            [0.1, 0.2, 0.7],
+            [0.25, 0.75, 0.0],
+            [0.1, 0.1, 0.8]
+        ])
+        targets = torch.LongTensor([1, 0, 1, 2, 2])
+        losses = torch.tensor([0.5, 1.0])
+        accumulator = MetricAccumulator(num_classes=3, device='cpu')
+        # Ragged batches of 3 and 2 samples
+        accumulator.update(losses[0], predictions[:3], targets[:3])
+        accumulator.update(losses[1], predictions[3:], targets[3:])
+        loss, accuracy = accumulator.compute()
+        assert loss == pytest.approx((0.5 * 3 + 1.0 * 2) / 5)
+        assert accuracy == pytest.approx(metrics.get_score(
+            targets.numpy(), predictions.numpy())['accuracy'])
+        assert np.all(accumulator.confusion_matrix == np.array([
+            [1, 0, 0],
+            [0, 1, 1],
+            [0, 1, 1]]))
+
+    def test_metric_accumulator_single_output(self):
+        """Rounded single outputs outside 0/1 don't break the counts."""
+        accumulator = MetricAccumulator(num_classes=1, device='cpu')
+        accumulator.update(torch.tensor(0.5),
+                           torch.tensor([[-3.2], [0.2], [5.0], [0.8]]),
+                           torch.LongTensor([0, 0, 1, 1]))
+        _, accuracy = accumulator.compute()
+        assert accuracy == pytest.approx(0.5)
+        assert np.all(accumulator.confusion_matrix == np.array([
+            [1, 0],
+            [0, 1]]))
+
+    def test_confusion_matrix(self):
+        """Merged batch updates match a single pass and sklearn."""
+        rng = np.random.RandomState(0)
+        targets = rng.randint(0, 4, 50)
+        predictions = rng.randint(0, 4, 50)
+        # Label 1 only ever appears as a prediction.
+        targets[targets == 1] = 0
+        single_pass = ConfusionMatrix.from_predictions(
+            targets, predictions, num_classes=6)
+        merged = ConfusionMatrix(num_classes=6)
+        for idx in range(0, 50, 16):
+            shard = ConfusionMatrix(num_classes=6)
+            shard.update(targets[idx:idx + 16], predictions[idx:idx + 16])
+            merged.merge(shard)
+        assert np.all(merged.counts == single_pass.counts)
+        assert np.all(merged.matrix == skl_metrics.confusion_matrix(
+            targets, predictions))
+        for average in [None, 'macro', 'micro', 'weighted']:
+            assert np.allclose(
+                merged.sensitivity(average),
+                skl_metrics.recall_score(targets, predictions,
+                                         average=average))
+            assert np.allclose(
+                merged.ppv(average),
+                skl_metrics.precision_score(targets, predictions,
+                                            average=average))
+            assert np.allclose(
+                merged.f1(average),
+                skl_metrics.f1_score(targets, predictions,
+                                     average=average))
+        assert merged.accuracy() == pytest.approx(
+            skl_metrics.accuracy_score(targets, predictions))
+
+    def test_confusion_matrix_labels(self, metrics):
+        """Arbitrary labels map to classes; fixed classes are checked."""
+        targets = np.array([-1, 3, 3, 7, -1, 7])
+        predictions = np.array([3, 3, -1, 7, -1, 3])
+        cm = ConfusionMatrix.from_predictions(targets, predictions)
+        assert np.all(cm.classes == np.array([-1, 3, 7]))
+        assert np.all(cm.matrix == skl_metrics.confusion_matrix(
+            targets, predictions))
+        assert np.allclose(
+            metrics.get_f1(targets, predictions),
+            skl_metrics.f1_score(targets, predictions, average=None))
+        with pytest.raises(ValueError):
+            ConfusionMatrix(num_classes=3).update(targets, predictions)
+
+    def test_auc(self, metrics, cnn_class):
+        """Exact and streaming AUC match sklearn, also in run_test."""
+        rng = np.random.RandomState(0)
+        targets = rng.randint(0, 3, 200)
+        # Two decimals so there are ties
+        raw_predictions = np.round(rng.rand(200, 3), 2)
+        expected = [skl_metrics.roc_auc_score(targets == i,
+                                              raw_predictions[:, i])
+                    for i in range(3)]
+        assert np.allclose(
+            metrics.get_auc(targets, raw_predictions, 3), expected)
+        assert metrics.get_auc(
+            targets, raw_predictions, 3, average='weighted') == \
+            pytest.approx(np.average(expected,
+                                     weights=np.bincount(targets)))
+        streaming_auc = StreamingAUC(3, n_bins=1000)
+        for idx in range(0, 200, 64):
+            streaming_auc.update(targets[idx:idx + 64],
+                                 raw_predictions[idx:idx + 64])
+        assert np.allclose(streaming_auc.compute(), expected)
+
+        test_input = torch.rand([10, *cnn_class.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 3, 4, 1, 2, 5, 3, 0])
+        test_dataloader = DataLoader(
+            TensorDataset(test_input, test_target), batch_size=3)
+        exact = metrics.run_test(cnn_class, test_dataloader)
+        streamed = metrics.run_test(cnn_class, test_dataloader,
+                                    auc_bins=10 ** 6)
+        assert streamed == pytest.approx(exact)
+        assert cnn_class.run_test(test_dataloader, auc_bins=10 ** 6) == \
+            pytest.approx(exact)
+
+    def test_bootstrap(self, metrics):
+        """Each resample is scored like the metrics on resampled data."""
+        rng = np.random.RandomState(0)
+        targets = rng.randint(0, 3, 100)
+        raw_predictions = rng.rand(100, 3)
+        # With one resample both bounds are that resample's value
+        indices = np.random.RandomState(1).randint(0, 100, size=[1, 100])[0]
+        resampled = metrics.bootstrap(
+            targets, raw_predictions, n_resamples=1, random_state=1)
+        resampled_predictions = raw_predictions[indices].argmax(axis=1)
+        assert resampled['f1']['lower'] == pytest.approx(
+            skl_metrics.f1_score(targets[indices], resampled_predictions,
+                                 average='macro'))
+        assert resampled['auc']['upper'] == pytest.approx(metrics.get_auc(
+            targets[indices], raw_predictions[indices], 3, average='macro'))
+
+        results = metrics.bootstrap(
+            targets, raw_predictions, n_resamples=500, batch_size=128,
+            random_state=0)
+        assert len(results) == 8
+        for result in results.values():
+            assert result['lower'] <= result['estimate'] <= result['upper']
+        assert results['accuracy']['estimate'] == pytest.approx(
+            metrics.get_accuracy(targets, raw_predictions.argmax(axis=1)))
+        with pytest.raises(ValueError):
+            metrics.bootstrap(targets, raw_predictions, metrics=['mcc'])
+
     def test_cross_validate_outputs(self, metrics, cnn_class):
         """Tests that the cross-validate outputs are in the correct form."""
         test_input = torch.ones([13, *cnn_class.in_dim]).float()
@@ -70,4 +216,111 @@ class TestMetrics:
             assert isinstance(averaged_results[k], float)
 
         for k in all_results:
-            assert isinstance(all_results[k], list)
\ No newline at end of file
+            assert isinstance(all_results[k], list)
+
+    def test_cross_validate_n_jobs(self, metrics, cnn_class, tmp_path):
+        """Folds run in worker processes give the serial results."""
+        cnn_class.device = 'cpu'
+        test_input = torch.rand([13, *cnn_class.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 3, 4, 1, 2, 2, 3, 0, 4, 5, 0])
+        test_dataset = TensorDataset(test_input, test_target)
+        test_dataloader = DataLoader(test_dataset, batch_size=4)
+
+        torch.manual_seed(0)
+        expected = metrics.cross_validate(
+            cnn_class, test_dataloader, 2, 1, average_results=False)
+        torch.manual_seed(0)
+        results = cnn_class.cross_validate(
+            test_dataloader, 2, 1, average_results=False, n_jobs=2)
+        assert results.keys() == expected.keys()
+        for m in expected:
+            assert np.allclose(results[m], expected[m], equal_nan=True)
+
+        # Memory-mapped copies travel as file paths
+        shared_dataset = SharedDataset(test_dataset, path=str(tmp_path))
+        unpickled = pickle.loads(pickle.dumps(shared_dataset))
+        for idx in [0, 12]:
+            assert all(torch.equal(a, b) for a, b in
+                       zip(unpickled[idx], test_dataset[idx]))
+        del unpickled
+        shared_dataset.close()
+        assert list(tmp_path.iterdir()) == []
+
+    @pytest.mark.parametrize('error', [KeyboardInterrupt, RuntimeError])
+    def test_cross_validate_n_jobs_interrupted(self, metrics, cnn_class,
+                                               monkeypatch, error):
+        """Failed parallel folds stop the workers without waiting on them.
+
+        An interrupt returns the completed folds by index, any other
+        error is raised.
+        """
+        from concurrent.futures import Future
+        from vulcanai2.models import metrics as metrics_module
+        calls = []
+        executors = []
+
+        class FailedFuture(Future):
+            """Future whose wait is interrupted or whose fold failed."""
+
+            def result(self, timeout=None):
+                raise error
+
+        class WorkerProcess(object):
+            """Record how the worker process is ended."""
+
+            def terminate(self):
+                calls.append('terminate')
+
+            def join(self, timeout=None):
+                calls.append('join')
+
+        class FailedExecutor(object):
+            """Finish fold 0, fail on fold 1, leave fold 2 running."""
+
+            def __init__(self, max_workers, mp_context):
+                self.futures = []
+                self._processes = {0: WorkerProcess()}
+                executors.append(self)
+
+            def submit(self, fn, *args):
+                if not self.futures:
+                    future = Future()
+                    future.set_result({'accuracy': 1.0})
+                elif len(self.futures) == 1:
+                    future = FailedFuture()
+                else:
+                    future = Future()
+                self.futures.append(future)
+                return future
+
+            def shutdown(self, wait=True):
+                calls.append(('shutdown', wait))
+
+        class RecordedDataset(metrics_module.SharedDataset):
+            """Record when the shared dataset is released."""
+
+            def close(self):
+                calls.append('close')
+                super().close()
+
+        monkeypatch.setattr(metrics_module, 'ProcessPoolExecutor',
+                            FailedExecutor)
+        monkeypatch.setattr(metrics_module, 'SharedDataset', RecordedDataset)
+        cnn_class.device = 'cpu'
+        test_input = torch.rand([9, *cnn_class.in_dim])
+        test_target = torch.LongTensor([0, 2, 1, 3, 4, 1, 2, 2, 3])
+        test_dataloader = DataLoader(TensorDataset(test_input, test_target))
+        if error is KeyboardInterrupt:
+            results = metrics.cross_validate(
+                cnn_class, test_dataloader, 3, 1, average_results=False,
+                n_jobs=3)
+            assert results['fold'] == [0]
+            assert results['accuracy'] == [1.0]
+        else:
+            with pytest.raises(error):
+                metrics.cross_validate(
+                    cnn_class, test_dataloader, 3, 1, average_results=False,
+                    n_jobs=3)
+        assert calls == [('shutdown', False), 'terminate', 'join', 'close']
+        # The fold that was still running is cancelled, not waited on
+        assert executors[0].futures[2].cancelled()
@@ -0,0 +1,131 @@
+"""Test the micro-batching InferenceServer."""
+import pytest
+import asyncio
+import json
+import time
+import numpy as np
+import torch
+from vulcanai2.models.dnn import DenseNet
+from vulcanai2.models.serving import InferenceServer
+from torch.utils.data import TensorDataset, DataLoader
+
+
+class TestInferenceServer:
+    """Define InferenceServer test class."""
+
+    @pytest.fixture
+    def dnn_class(self):
+        """Create DenseNet with prediction layer."""
+        return DenseNet(
+            name='Test_DenseNet_class',
+            in_dim=(20),
+            config={
+                'dense_units': [10],
+                'dropout': 0.5,
+            },
+            num_classes=3,
+            device='cpu'
+        )
+
+    def test_predict_batches_requests(self, dnn_class):
+        """Concurrent requests are coalesced and match forward_pass."""
+        test_input = torch.rand([5, *dnn_class.in_dim])
+        expected = dnn_class.forward_pass(
+            DataLoader(TensorDataset(test_input, test_input)))
+        server = InferenceServer(
+            dnn_class, max_batch_size=4, max_wait_ms=50)
+
+        async def run():
+            outputs = await asyncio.gather(
+                *[server.predict(x.tolist()) for x in test_input])
+            await server.close()
+            return outputs
+
+        outputs = asyncio.new_event_loop().run_until_complete(run())
+        assert np.allclose(np.stack(outputs), expected, atol=1e-6)
+        stats = server.stats()
+        assert stats['requests'] == 5
+        assert stats['batches'] == 2
+        assert stats['p99_latency_ms'] >= stats['p50_latency_ms'] > 0
+
+    def test_bad_request_in_batch(self, dnn_class):
+        """A malformed request only fails its own caller."""
+        good_input = torch.rand(dnn_class.in_dim)
+        server = InferenceServer(
+            dnn_class, max_batch_size=4, max_wait_ms=50)
+
+        async def run():
+            outputs = await asyncio.gather(
+                server.predict(good_input.tolist()),
+                server.predict([0.5] * 7),
+                return_exceptions=True)
+            await server.close()
+            return outputs
+
+        good, bad = asyncio.new_event_loop().run_until_complete(run())
+        assert isinstance(bad, ValueError)
+        assert good.shape == tuple(dnn_class.out_dim)
+
+    def test_close_with_pending_requests(self, dnn_class):
+        """Closing fails requests that are running or still queued."""
+        server = InferenceServer(
+            dnn_class, max_batch_size=2, max_wait_ms=1000)
+        run_batch = server._run_batch
+
+        def slow_run_batch(samples):
+            time.sleep(0.2)
+            return run_batch(samples)
+
+        server._run_batch = slow_run_batch
+
+        async def run():
+            # The first two run as one batch, the third stays queued
+            requests = [
+                asyncio.ensure_future(server.predict(
+                    torch.rand(dnn_class.in_dim).tolist()))
+                for _ in range(3)]
+            await asyncio.sleep(0.05)
+            await server.close()
+            return await asyncio.wait_for(asyncio.gather(
+                *requests, return_exceptions=True), 1)
+
+        outputs = asyncio.new_event_loop().run_until_complete(run())
+        assert len(outputs) == 3
+        for output in outputs:
+            assert isinstance(output, RuntimeError)
+
+    def test_http_roundtrip(self, dnn_class):
+        """Predictions and stats are served over HTTP."""
+        server = InferenceServer(dnn_class, max_wait_ms=0)
+
+        async def request(port, method, path, body=b''):
+            reader, writer = await asyncio.open_connection(
+                '127.0.0.1', port)
+            writer.write(
+                '{} {} HTTP/1.1\r\nContent-Length: {}\r\n'
+                'Connection: close\r\n\r\n'.format(
+                    method, path, len(body)).encode() + body)
+            response = await reader.read()
+            writer.close()
+            head, _, payload = response.partition(b'\r\n\r\n')
+            return int(head.split()[1]), json.loads(payload.decode())
+
+        async def run():
+            http_server = await server.start(port=0)
+            port = http_server.sockets[0].getsockname()[1]
+            body = json.dumps(dict(inputs=[0.5] * 20)).encode()
+            responses = [
+                await request(port, 'POST', '/predict', body),
+                await request(port, 'POST', '/predict', b'{}'),
+                await request(port, 'GET', '/stats')]
+            http_server.close()
+            await server.close()
+            return responses
+
+        (status, predict), (bad_status, _), (_, stats) = \
+            asyncio.new_event_loop().run_until_complete(run())
+        assert status == 200
+        assert len(predict['outputs']) == 3
+        assert np.isclose(sum(predict['outputs']), 1)
+        assert bad_status == 400
+        assert stats['requests'] == 1